@@ -10,16 +10,24 @@ from channels.auth import AuthMiddlewareStack
 
 import os
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
+from core.embedding.service import warm_up as warm_up_embedding
 from core.routing import websocket_urlpatterns
 from .socket_auth import QueryAuthMiddleware
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
 
+django_asgi_app = get_asgi_application()
+
+# Load the embedding model once per worker, before the first query arrives.
+if settings.EMBEDDING_WARM_UP:
+    warm_up_embedding()
+
 application = ProtocolTypeRouter(
     {
-        "http": get_asgi_application(),
+        "http": django_asgi_app,
         "websocket": QueryAuthMiddleware(URLRouter(websocket_urlpatterns)),
     }
 )
@@ -169,11 +169,71 @@ if DEBUG:
 # AI Settings
 MAX_FOLLOW_UP_LIMIT=int(os.getenv("max_follow_up_questions", 3))
 TOP_K=5
+# Adaptive retrieval: chunks below RETRIEVAL_MIN_SIMILARITY (cosine) or more than
+# RETRIEVAL_SCORE_GAP (relative) below the best match are dropped, at most RETRIEVAL_MAX_K are sent.
+RETRIEVAL_MIN_SIMILARITY=float(os.getenv("retrieval_min_similarity", 0.3))
+RETRIEVAL_SCORE_GAP=float(os.getenv("retrieval_score_gap", 0.25))
+RETRIEVAL_MAX_K=int(os.getenv("retrieval_max_k", 20))
+# Local out-of-context check before the first LLM call: "enforce" answers out of context
+# without calling the LLM, "shadow" only logs and counts its decisions, "off" disables it.
+# Switch to "enforce" only once the thresholds are calibrated on the shadow decisions
+# (out_of_context_gate_decisions_total) and build_topic_centroids has been run.
+OUT_OF_CONTEXT_GATE_MODE=os.getenv("out_of_context_gate_mode", "shadow")
+OUT_OF_CONTEXT_GATE_RETRIEVAL_THRESHOLD=float(os.getenv("out_of_context_gate_retrieval_threshold", RETRIEVAL_MIN_SIMILARITY))
+OUT_OF_CONTEXT_GATE_CENTROID_THRESHOLD=float(os.getenv("out_of_context_gate_centroid_threshold", 0.35))
+# Upper bound on the (locally estimated) tokens of retrieved context sent per LLM call
+CONTEXT_TOKEN_BUDGET=int(os.getenv("context_token_budget", 1500))
 MODEL_NAME="sentence-transformers/all-MiniLM-L6-v2"
 DATABASE=os.getenv('database')
 PINECONE_API_KEY=os.getenv('pinecone_api_key')
 PINECONE_INDEX_NAME="textbook-chunks"
-CHUNKS_FILE="text_chunks.json"
+EMBEDDING_DIMENSION=384
+
+# Vector store backend: numpy | faiss-flat | faiss-hnsw | pinecone
+# (the legacy `database=faiss` value maps to faiss-flat)
+VECTOR_STORE = {
+    "BACKEND": os.getenv("vector_store", {"faiss": "faiss-flat"}.get(DATABASE, DATABASE)),
+    "PATH": os.getenv("vector_store_path", "vector_index.bin"),
+    "OPTIONS": {},
+}
+if VECTOR_STORE["BACKEND"] == "pinecone":
+    VECTOR_STORE["OPTIONS"] = {"api_key": PINECONE_API_KEY, "index_name": PINECONE_INDEX_NAME}
+elif VECTOR_STORE["BACKEND"] == "faiss-hnsw":
+    # See `manage.py index_benchmark` for choosing these
+    VECTOR_STORE["OPTIONS"] = {
+        "m": int(os.getenv("hnsw_m", 32)),
+        "ef_construction": int(os.getenv("hnsw_ef_construction", 40)),
+        "ef_search": int(os.getenv("hnsw_ef_search", 16)),
+    }
+CHUNK_STORE_PATH=os.getenv("chunk_store_path", "chunks")
+TOPIC_CENTROIDS_PATH=os.getenv("topic_centroids_path", f"{CHUNK_STORE_PATH}.centroids.npz")
+# torch | onnx | onnx-int8
+EMBEDDING_BACKEND=os.getenv("embedding_backend", "torch")
+EMBEDDING_ONNX_DIR=os.getenv("embedding_onnx_dir", str(BASE_DIR / "onnx_models"))
+# Number of dedicated embedding processes, 0 embeds inline in the web worker
+EMBEDDING_WORKERS=int(os.getenv("embedding_workers", 0))
+EMBEDDING_TORCH_THREADS=int(os.getenv("embedding_torch_threads", 1))
+EMBEDDING_WARM_UP=int(os.getenv("embedding_warm_up", 1)) == 1
+EMBEDDING_BATCH_WINDOW_MS=float(os.getenv("embedding_batch_window_ms", 5))
+EMBEDDING_MAX_BATCH_SIZE=int(os.getenv("embedding_max_batch_size", 32))
+# Query embedding cache: "local" (per process), "django" (shared through CACHES) or "" to disable
+EMBEDDING_CACHE_BACKEND=os.getenv("embedding_cache_backend", "local")
+EMBEDDING_CACHE_SIZE=int(os.getenv("embedding_cache_size", 2048))
+EMBEDDING_CACHE_TTL=int(os.getenv("embedding_cache_ttl", 24 * 60 * 60))
+EMBEDDING_CACHE_ALIAS="default"
+
+# Semantic cache of final answers, per process. Purges reach every process through
+# ANSWER_CACHE_ALIAS when that cache is shared (e.g. Redis).
+ANSWER_CACHE_ENABLED=int(os.getenv("answer_cache_enabled", 1)) == 1
+ANSWER_CACHE_THRESHOLD=float(os.getenv("answer_cache_threshold", 0.95))  # Cosine similarity of the queries
+ANSWER_CACHE_SIZE=int(os.getenv("answer_cache_size", 1024))
+ANSWER_CACHE_TTL=int(os.getenv("answer_cache_ttl", 24 * 60 * 60))
+ANSWER_CACHE_ALIAS="default"
+# Seconds between reads of the purge generation from ANSWER_CACHE_ALIAS
+ANSWER_CACHE_GENERATION_CHECK_INTERVAL=float(os.getenv("answer_cache_generation_check_interval", 5))
+
+# Prometheus scrape endpoint (/metrics/)
+METRICS_ALLOWED_IPS=os.getenv("metrics_allowed_ips", "127.0.0.1").split(",")
 
 
 CHANNEL_LAYERS = {
@@ -1,6 +1,8 @@
 from django.contrib import admin
 from django.urls import include, path
 
+from core.metrics import metrics_view
+
 admin.site.site_header = "QUINTET Admin"
 admin.site.index_title = "QUINTET Features"
 admin.site.site_title = "QUINTET Admin"
@@ -8,4 +10,5 @@ admin.site.site_title = "QUINTET Admin"
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/v1/', include('api.urls')),
+    path('metrics/', metrics_view),
 ]
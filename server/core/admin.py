@@ -1,5 +1,6 @@
-from django.contrib import admin
-from .models import SystemPrompt, Conversation, Message, AIResponse, PerformanceMetric
+from django.contrib import admin, messages
+from .assistant.answer_cache import get_answer_cache
+from .models import SystemPrompt, Conversation, Message, AIResponse, PerformanceMetric, PerformanceRollup
 
 @admin.register(SystemPrompt)
 class SystemPromptAdmin(admin.ModelAdmin):
@@ -7,6 +8,16 @@ class SystemPromptAdmin(admin.ModelAdmin):
     list_filter = ('assistant_type', 'is_active')
     search_fields = ('assistant_type', 'version', 'content')
     ordering = ('-created_at',)
+    actions = ('purge_answer_cache',)
+
+    @admin.action(description="Purge the semantic answer cache (all prompt versions)")
+    def purge_answer_cache(self, request, queryset):
+        answer_cache = get_answer_cache()
+        if answer_cache is None:
+            self.message_user(request, "The answer cache is disabled.", messages.WARNING)
+            return
+        answer_cache.purge()
+        self.message_user(request, "Purged the answer cache.")
 
 @admin.register(Conversation)
 class ConversationAdmin(admin.ModelAdmin):
@@ -50,4 +61,14 @@ class PerformanceMetricAdmin(admin.ModelAdmin):
     raw_id_fields = ('conversation',)
 
     def get_queryset(self, request):
-        return super().get_queryset(request).select_related('conversation')
\ No newline at end of file
+        return super().get_queryset(request).select_related('conversation')
+
+@admin.register(PerformanceRollup)
+class PerformanceRollupAdmin(admin.ModelAdmin):
+    list_display = ('id', 'system_prompt', 'hour', 'queries', 'out_of_context', 'input_tokens', 'output_tokens')
+    list_filter = ('system_prompt', 'hour')
+    ordering = ('-hour',)
+    raw_id_fields = ('system_prompt',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('system_prompt')
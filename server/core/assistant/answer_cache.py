@@ -0,0 +1,158 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Hashable, Optional, Set
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+
+from ..base.metrics import Counter
+from ..retrieval.vector_store import normalize
+
+
+ANSWER_CACHE_HITS = Counter("answer_cache_hits_total", "Queries answered from the semantic answer cache")
+ANSWER_CACHE_MISSES = Counter("answer_cache_misses_total", "Queries that went through retrieval and the LLM")
+
+# Bumped by `AnswerCache.purge`, through the Django cache so every worker process sees it
+GENERATION_KEY = "answer_cache:generation"
+
+
+@dataclass
+class CachedAnswer:
+    response: str
+    tags: dict
+    similarity: float
+
+
+@dataclass
+class _Entry:
+    scope: Hashable
+    vector: np.ndarray
+    response: str
+    tags: dict
+    expires: float
+
+
+class AnswerCache:
+    """
+    Per-process semantic cache of final answers, keyed by query embedding.
+
+    `lookup` returns the answer of the most similar cached query of the same
+    `scope` (system prompt version, index version, ...) when its cosine
+    similarity reaches `threshold`. Entries are evicted least recently used
+    first beyond `max_size` and expire after `ttl` seconds. `purge` empties
+    the cache of every process sharing the Django cache `cache_alias`, within
+    `generation_check_interval` seconds: the generation is read from the
+    Django cache at most that often, not on every lookup.
+    """
+
+    def __init__(
+        self,
+        threshold: float,
+        max_size: int = 1024,
+        ttl: float = 24 * 60 * 60,
+        cache_alias: str = "default",
+        generation_check_interval: float = 5.0,
+    ):
+        self.threshold = threshold
+        self.max_size = max_size
+        self.ttl = ttl
+        self.cache_alias = cache_alias
+        self.generation_check_interval = generation_check_interval
+        self._next_generation_check = 0.0
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._scopes: Dict[Hashable, Set[int]] = {}
+        self._next_key = 0
+        self._generation = None
+        self._lock = threading.Lock()
+
+    def _remove(self, key: int):
+        entry = self._entries.pop(key)
+        keys = self._scopes[entry.scope]
+        keys.discard(key)
+        if not keys:
+            del self._scopes[entry.scope]
+
+    def _check_generation(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now < self._next_generation_check:
+            return
+        self._next_generation_check = now + self.generation_check_interval
+        generation = caches[self.cache_alias].get(GENERATION_KEY, 0)
+        if generation != self._generation:
+            self.clear()
+            self._generation = generation
+
+    def lookup(self, scope: Hashable, vector: np.ndarray) -> Optional[CachedAnswer]:
+        self._check_generation()
+        vector = normalize(vector)[0]
+        now = time.monotonic()
+
+        with self._lock:
+            for key in [key for key in self._scopes.get(scope, ()) if self._entries[key].expires < now]:
+                self._remove(key)
+
+            keys = list(self._scopes.get(scope, ()))
+            best = None
+            if keys:
+                similarities = np.stack([self._entries[key].vector for key in keys]) @ vector
+                best = int(np.argmax(similarities))
+
+            if best is None or similarities[best] < self.threshold:
+                ANSWER_CACHE_MISSES.inc()
+                return None
+
+            self._entries.move_to_end(keys[best])
+            entry = self._entries[keys[best]]
+
+        ANSWER_CACHE_HITS.inc()
+        return CachedAnswer(entry.response, dict(entry.tags), float(similarities[best]))
+
+    def store(self, scope: Hashable, vector: np.ndarray, response: str, tags: dict):
+        self._check_generation()
+        with self._lock:
+            key, self._next_key = self._next_key, self._next_key + 1
+            self._entries[key] = _Entry(scope, normalize(vector)[0], response, dict(tags), time.monotonic() + self.ttl)
+            self._scopes.setdefault(scope, set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._scopes.clear()
+
+    def purge(self):
+        cache = caches[self.cache_alias]
+        try:
+            cache.incr(GENERATION_KEY)
+        except ValueError:
+            cache.set(GENERATION_KEY, 1, timeout=None)
+        self._check_generation(force=True)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_answer_cache = None
+_answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> Optional[AnswerCache]:
+    """Returns the process wide answer cache, or None when ANSWER_CACHE_ENABLED is off."""
+    global _answer_cache
+    if not settings.ANSWER_CACHE_ENABLED:
+        return None
+    if _answer_cache is None:
+        with _answer_cache_lock:
+            if _answer_cache is None:
+                _answer_cache = AnswerCache(
+                    settings.ANSWER_CACHE_THRESHOLD,
+                    max_size=settings.ANSWER_CACHE_SIZE,
+                    ttl=settings.ANSWER_CACHE_TTL,
+                    cache_alias=settings.ANSWER_CACHE_ALIAS,
+                    generation_check_interval=settings.ANSWER_CACHE_GENERATION_CHECK_INTERVAL,
+                )
+    return _answer_cache
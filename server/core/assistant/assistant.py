@@ -1,27 +1,45 @@
 from django.conf import settings
-from django.db import transaction
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AbstractUser
-import logging
+import hashlib
 import json
-import os
+import logging
 import numpy as np
-from transformers import AutoTokenizer, AutoModel
-import torch
 
-# import faiss
-from pinecone import Pinecone
-from typing import List, Tuple, Optional
+from functools import partial
+from typing import Callable, List, Set, Tuple, Optional
 from ..base.conversation import Conversation as BaseConversation
-
+from ..base.llm import LLMBackend
+from ..embedding.service import get_query_embedder
+from ..base.metrics import Counter
+from ..base.singleflight import SingleFlight
+from ..embedding.cache import normalize_text
+from ..retrieval.service import get_chunks, get_out_of_context_gate, get_vector_store
+from ..retrieval.context import ContextPacker, count_tokens, format_context, merge_blocks
+from ..retrieval.fusion import split_questions
+from ..retrieval.session import RetrievalSession
+
+from .answer_cache import get_answer_cache
+from .instrumentation import QueryTimings
 from ..models import Conversation, Message, AIResponse, PerformanceMetric, SystemPrompt
+from ..write_behind import WriteBehindBuffer
+from user_course.models import LearningObject
 
 
 logger = logging.getLogger(__name__)
 
-# Set OpenMP environment variable to ignore duplicate library error
-os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
-os.environ["TOKENIZERS_PARALLELISM"] = "false"
+OUT_OF_CONTEXT_GATE_DECISIONS = Counter(
+    "out_of_context_gate_decisions_total",
+    "Local out-of-context decisions, against the LLM outcome (skipped when the gate answered)",
+    ("mode", "gate", "llm"),
+)
+COALESCED_QUERIES = Counter(
+    "assistant_coalesced_queries_total",
+    "Queries answered by waiting on an identical query already in flight",
+)
+
+# Queries being answered in this process, see QuantumAssistantConversation.process_query
+IN_FLIGHT_QUERIES = SingleFlight()
 
 
 class QuantumAssistantConversation(BaseConversation):
@@ -36,15 +54,26 @@ class QuantumAssistantConversation(BaseConversation):
         "internal_sources",
         "sentiment_score"
     ]
-
-    def __init__(self, user: type[AbstractUser], conversation_id: Optional[str] = None):
-        super().__init__(conversation_id)
+    # Either one decides the next step of process_query, the rest of the response is not needed
+    stop_tags = ["out_of_context", "insufficient_data"]
+    # The answer shown to the student, the other tags are for the server
+    streamed_tags = ["concept_explanation"]
+
+    def __init__(
+        self, user: type[AbstractUser], conversation_id: Optional[str] = None, llm: Optional[LLMBackend] = None
+    ):
+        super().__init__(conversation_id, llm)
         self.user = user
         self.conversation_obj = self._get_or_create_conversation(conversation_id)
-        self.tokenizer = AutoTokenizer.from_pretrained(settings.MODEL_NAME)
-        self.model = AutoModel.from_pretrained(settings.MODEL_NAME)
-        self.index = self._initialize_database()
-        self.chunks = self._load_chunks()
+        self.embedder = get_query_embedder()
+        self.vector_store = get_vector_store()
+        self.chunks = get_chunks()
+        self.answer_cache = get_answer_cache()
+        self.out_of_context_gate = get_out_of_context_gate()
+        # New Message, AIResponse and PerformanceMetric rows, inserted at stage boundaries
+        self.pending = WriteBehindBuffer()
+        # Chunks already sent to the model in this conversation
+        self.sent_chunk_ids: Set[int] = set()
 
     def _get_or_create_conversation(self, conversation_id):
         if conversation_id:
@@ -60,140 +89,311 @@ class QuantumAssistantConversation(BaseConversation):
                 system_prompt=system_prompt, user=self.user
             )
 
-    def _initialize_database(self):
-        if settings.DATABASE == "pinecone":
-            pc = Pinecone(api_key=settings.PINECONE_API_KEY)
-            index = pc.Index(settings.PINECONE_INDEX_NAME)
-            logger.info(f"Connected to Pinecone index: {settings.PINECONE_INDEX_NAME}")
-            return index
-        elif settings.DATABASE == "faiss":
-            if os.path.exists(settings.FAISS_INDEX_FILE):
-                index = faiss.read_index(settings.FAISS_INDEX_FILE)
-                logger.info(
-                    f"Loaded FAISS index from file: {settings.FAISS_INDEX_FILE}"
-                )
-                return index
-            else:
-                logger.error(
-                    "FAISS index file not found. Please run the indexing process first."
-                )
-                raise FileNotFoundError(
-                    "FAISS index file not found. Please run the indexing process first."
-                )
-        else:
-            logger.error("Invalid database choice. Use 'pinecone' or 'faiss'.")
-            raise ValueError("Invalid database choice. Use 'pinecone' or 'faiss'.")
-
-    def _load_chunks(self):
-        if os.path.exists(settings.CHUNKS_FILE):
-            with open(settings.CHUNKS_FILE, "r") as f:
-                chunks = json.load(f)
-            logger.info(f"Loaded {len(chunks)} chunks from file.")
-            return chunks
-        else:
-            logger.error(
-                "Chunks file not found. Please run the indexing process first."
-            )
-            raise FileNotFoundError(
-                "Chunks file not found. Please run the indexing process first."
-            )
-
     def create_embedding(self, text: str) -> np.ndarray:
-        inputs = self.tokenizer(
-            text, return_tensors="pt", padding=True, truncation=True, max_length=512
+        return self.embedder.create_embedding(text)
+
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
+        return self.embedder.embed(queries)
+
+    def get_search_scope(self, course_id: Optional[int]) -> Tuple[Optional[np.ndarray], Optional[List[str]]]:
+        """
+        Ids of the chunks that belong to the learning objects (cells) of the
+        user's course and the ids of those cells, or (None, None) to search
+        the whole corpus.
+        """
+        if course_id is None:
+            return None, None
+
+        cell_ids = list(LearningObject.objects.filter(
+            course_id=course_id, course__user=self.user
+        ).values_list("object_id", flat=True))
+        chunk_ids = self.chunks.ids_for(cell_ids=cell_ids)
+        if not len(chunk_ids):
+            logger.warning(f"No indexed chunks for course {course_id}, searching the whole corpus.")
+            return None, None
+        return chunk_ids, cell_ids
+
+    @staticmethod
+    def retrieval_depths() -> List[int]:
+        """
+        Number of chunks the model has been given after each iteration:
+        TOP_K, growing by 5 more per follow-up than the previous one did.
+        """
+        depths, depth = [], settings.TOP_K
+        for iteration in range(settings.MAX_FOLLOW_UP_LIMIT):
+            depth += iteration * 5
+            depths.append(depth)
+        return depths
+
+    def process_query(
+        self,
+        user_query: str,
+        include_external_data=False,
+        course_id=None,
+        on_text: Optional[Callable[[int, str], None]] = None,
+    ) -> List[Message]:
+        """
+        Answers `user_query`, asking Claude again with more context while it
+        reports insufficient data, and returns the messages created. With
+        `on_text`, Claude's responses are streamed: `on_text(iteration, text)`
+        is called with each text delta of the answer (`streamed_tags`).
+
+        The answer is reused, without retrieval or LLM call, from the answer
+        cache or from an identical query (same normalized text, conversation
+        history and cache scope) that another conversation is answering at
+        the same time. Only the first question of a conversation goes through
+        the answer cache, later answers depend on the earlier turns.
+
+        Per-stage timings and token usage are saved as PerformanceMetric rows
+        and exported on /metrics/, labelled with the system prompt version.
+        """
+        timings = QueryTimings(self.prompt_version())
+        cache_scope = self.answer_cache_scope(course_id, include_external_data)
+        use_answer_cache = self.answer_cache is not None and not self.conversation
+        if use_answer_cache:
+            with timings.stage("embed"):
+                query_embedding = self.create_embedding(user_query)
+            with timings.stage("search"):
+                cached = self.answer_cache.lookup(cache_scope, query_embedding)
+            if cached is not None:
+                logger.info(f"Answering from the answer cache (similarity {cached.similarity:.3f})")
+                return self.reuse_answer(user_query, cached.response, cached.tags, timings)
+
+        key = (normalize_text(user_query), self.history_digest(), cache_scope)
+        messages, shared = IN_FLIGHT_QUERIES.do(
+            key,
+            lambda: self.run_query(
+                user_query, include_external_data, course_id, on_text, cache_scope, use_answer_cache, timings
+            ),
         )
-        with torch.no_grad():
-            outputs = self.model(**inputs)
-        return outputs.last_hidden_state.mean(dim=1).squeeze().numpy()
-
-    def search_similar_chunks(
-        self, query_embedding: np.ndarray, top_k: int = 5
-    ) -> List[Tuple[str, float]]:
-        if settings.DATABASE == "pinecone":
-            results = self.index.query(
-                vector=query_embedding.tolist(), top_k=top_k, include_metadata=True
-            )
-            return [
-                (match["metadata"]["text"], float(match["score"]))
-                for match in results["matches"]
-            ]
-        elif settings.DATABASE == "faiss":
-            distances, indices = self.index.search(np.array([query_embedding]), top_k)
-            return [
-                (self.chunks[int(i)], float(d))
-                for i, d in zip(indices[0], distances[0])
-            ]
-
-    @transaction.atomic
-    def process_query(self, user_query: str, include_external_data=False) -> str:
+        if shared:
+            logger.info("Reusing the answer of an identical query in flight")
+            COALESCED_QUERIES.inc()
+            return self.reuse_answer(user_query, messages[-1].content, messages[-1].entities, timings)
+        return messages
+
+    def run_query(
+        self,
+        user_query: str,
+        include_external_data: bool,
+        course_id: Optional[int],
+        on_text: Optional[Callable[[int, str], None]],
+        cache_scope: tuple,
+        use_answer_cache: bool,
+        timings: QueryTimings,
+    ) -> List[Message]:
+        """
+        The retrieval and LLM loop of `process_query`. No transaction is held
+        during LLM calls: rows are buffered in `self.pending` and inserted in
+        bulk once per iteration.
+        """
         iterations = settings.MAX_FOLLOW_UP_LIMIT
         response = None
 
-        extracted_content = settings.TOP_K
-        internal_query = user_query
+        depths = self.retrieval_depths()
+        chunk_ids, cell_ids = self.get_search_scope(course_id)
+        retrieval = RetrievalSession(
+            self.vector_store,
+            min(depths[-1], settings.RETRIEVAL_MAX_K),
+            chunk_ids,
+            cell_ids,
+            min_similarity=settings.RETRIEVAL_MIN_SIMILARITY,
+            score_gap=settings.RETRIEVAL_SCORE_GAP,
+            seen=self.sent_chunk_ids,
+        )
+        packer = ContextPacker(self.chunks, settings.CONTEXT_TOKEN_BUDGET, self.sent_chunk_ids)
+        # The user query, plus the follow-up questions of an insufficient_data response
+        search_queries = [user_query]
         messages = []
-
-        while iterations:
-            logger.info(f"Processing iteration {iterations}")
-            extracted_content += (settings.MAX_FOLLOW_UP_LIMIT - iterations) * 5
-            query_embedding = self.create_embedding(internal_query)
-            relevant_chunks = self.search_similar_chunks(
-                query_embedding, extracted_content
-            )
-            system_prompt, context = self.prepare_system_prompt(
-                internal_query, relevant_chunks
-            )
-
-            internal_query, tags = self.prepare_user_prompt(
-                query=user_query,
-                context=context,
-                follow_up_limit_remaining=iterations,
-                external_source_allowed=include_external_data,
-            )
-
-            logger.debug(f"System prompt: {system_prompt}")
-            logger.debug(f"Internal query: {internal_query}")
-
-            user_message = self.add_message("user", internal_query, tags)
-
-            # If first iteration, save as original message.
-            if iterations == settings.MAX_FOLLOW_UP_LIMIT:
-                user_message.is_original_user_query = True
-                user_message.save()
-
-            messages.append(user_message)
-
-            response, tags = self.send_to_claude_api(system_prompt)
-
-            assistant_message = self.add_message("assistant", response, tags)
-            messages.append(assistant_message)
-
-            if tags.get("insufficient_data"):
-                logger.info("Insufficient data detected")
-                internal_query = user_query + " \n " + tags.get("insufficient_data")
-            elif tags.get("out_of_context"):
-                assistant_message.is_out_of_context_message = True
-                assistant_message.save()
-                break
-            elif tags.get('concept_explanation'):
-                assistant_message.is_answer = True
-
-                if tags.get('sentiment_score'):
-                    assistant_message.sentiment = tags['sentiment_score']
-                    
-                assistant_message.save()
-                break
-
-            iterations -= 1
+        # Only a conversation's first question is gated: follow-ups ("can you give an example?")
+        # score low on their own, Claude answers them from the history.
+        gate_mode = (
+            settings.OUT_OF_CONTEXT_GATE_MODE if not include_external_data and not self.conversation else "off"
+        )
+        gate_decision = None
+
+        # History up to the last flushed iteration, the rest is dropped if the query fails
+        history_length = len(self.conversation)
+        try:
+            while iterations:
+                logger.info(f"Processing iteration {iterations}")
+                iteration = settings.MAX_FOLLOW_UP_LIMIT - iterations
+                page_size = depths[iteration] - (depths[iteration - 1] if iteration else 0)
+
+                with timings.stage("embed"):
+                    query_embeddings = self.embed_queries(search_queries)
+
+                # Earlier chunks are already in the conversation, only send the next page.
+                with timings.stage("search"):
+                    page = retrieval.next_page(query_embeddings, page_size)
+
+                with timings.stage("prompt"):
+                    packed = packer.pack(page)
+                    system_prompt, context = self.prepare_system_prompt(
+                        user_query, packed.blocks
+                    )
+
+                    internal_query, tags = self.prepare_user_prompt(
+                        query=user_query,
+                        context=context,
+                        follow_up_limit_remaining=iterations,
+                        external_source_allowed=include_external_data,
+                    )
+                logger.debug(f"Packed {len(packed.chunks)} chunks into {packed.tokens} context tokens")
+
+                logger.debug(f"System prompt: {system_prompt}")
+                logger.debug(f"Internal query: {internal_query}")
+
+                # Only the chunk ids are persisted, rebuild_user_prompt recreates the prompt sent.
+                tags["chunks"] = [[int(chunk_id), round(float(score), 4)] for chunk_id, score in packed.chunks]
+                tags["index_version"] = self.chunks.version
+
+                # The first iteration's message is the original user query. Its token count is a
+                # local estimate, the API only reports the tokens of the whole request.
+                user_message = self.add_message(
+                    "user",
+                    internal_query,
+                    tags,
+                    stored_content=user_query,
+                    is_original_user_query=iteration == 0,
+                    tokens=count_tokens(internal_query),
+                )
+                messages.append(user_message)
+
+                if iteration == 0 and gate_mode != "off":
+                    with timings.stage("search"):
+                        gate_decision = self.out_of_context_gate.check(
+                            query_embeddings[0], retrieval.best_score(query_embeddings[0])
+                        )
+                    logger.info(f"Out-of-context gate ({gate_mode}): {gate_decision}")
+
+                if gate_decision and gate_decision.out_of_context and gate_mode == "enforce":
+                    # Nothing in the curriculum is close to the query, don't pay for an LLM call.
+                    response, tags = self.out_of_context_response()
+                    self.add_ai_response(user_message, response, "LOCAL")
+                    output_tokens = None
+                else:
+                    response, tags = self.send_to_claude_api(
+                        system_prompt, partial(on_text, iteration) if on_text else None
+                    )
+                    call = self.last_call
+                    # Only the first call's time to first token is what the student waits for.
+                    if "llm_ttft" not in timings.seconds and call.first_token_seconds is not None:
+                        timings.add("llm_ttft", call.first_token_seconds)
+                    timings.add("llm_total", call.total_seconds - call.parse_seconds)
+                    timings.add("parse", call.parse_seconds)
+                    timings.add_tokens(call.response.input_tokens, call.response.output_tokens)
+                    self.add_ai_response(user_message, response, "CLAUDE", processing_time=call.total_seconds)
+                    output_tokens = call.response.output_tokens
+
+                assistant_message = self.add_message("assistant", response, tags, tokens=output_tokens)
+                messages.append(assistant_message)
+
+                if tags.get("insufficient_data"):
+                    logger.info("Insufficient data detected")
+                    # Searched one by one and fused, a single concatenated query dilutes them.
+                    search_queries = [user_query] + split_questions(tags["insufficient_data"])
+                elif tags.get("out_of_context"):
+                    assistant_message.is_out_of_context_message = True
+                elif tags.get('concept_explanation'):
+                    assistant_message.is_answer = True
+
+                    if tags.get('sentiment_score'):
+                        assistant_message.sentiment = tags['sentiment_score']
+
+                # Stage boundary: the iteration's rows are written before the next LLM call.
+                with timings.stage("db_write"):
+                    self.pending.flush()
+                history_length = len(self.conversation)
+
+                if assistant_message.is_out_of_context_message:
+                    break
+                if assistant_message.is_answer:
+                    if use_answer_cache:
+                        self.answer_cache.store(cache_scope, query_embeddings[0], response, tags)
+                    break
+
+                iterations -= 1
+        except BaseException:
+            # Otherwise the next query's flush would write this iteration's rows, e.g. an orphan question
+            self.pending.discard()
+            del self.conversation[history_length:]
+            raise
+
+        if gate_decision is not None:
+            if gate_decision.out_of_context and gate_mode == "enforce":
+                llm_outcome = "skipped"
+            else:
+                llm_outcome = "out_of_context" if messages[-1].is_out_of_context_message else "in_context"
+            OUT_OF_CONTEXT_GATE_DECISIONS.labels(
+                mode=gate_mode,
+                gate="out_of_context" if gate_decision.out_of_context else "in_context",
+                llm=llm_outcome,
+            ).inc()
 
         # Save performance metrics
-        PerformanceMetric.objects.create(
+        self.save_metrics(
+            settings.MAX_FOLLOW_UP_LIMIT - iterations, messages[-1].is_out_of_context_message, timings
+        )
+        return messages
+
+    def save_metrics(self, iterations: int, out_of_context: bool, timings: QueryTimings):
+        """
+        Writes the iteration count, whether the query was out of context and
+        the timings in one bulk insert, then exports them. The persisted
+        db_write time leaves out this last write.
+        """
+        self.pending.add(PerformanceMetric(
             conversation=self.conversation_obj,
             metric_name="iterations",
-            metric_value=settings.MAX_FOLLOW_UP_LIMIT - iterations,
+            metric_value=iterations,
+        ))
+        self.pending.add(PerformanceMetric(
+            conversation=self.conversation_obj,
+            metric_name="out_of_context",
+            metric_value=int(out_of_context),
+        ))
+        for metric in timings.performance_metrics(self.conversation_obj):
+            self.pending.add(metric)
+        with timings.stage("db_write"):
+            self.pending.flush()
+        timings.observe()
+
+    def prompt_version(self) -> str:
+        system_prompt = self.conversation_obj.system_prompt
+        return system_prompt.version if system_prompt else "none"
+
+    def answer_cache_scope(self, course_id: Optional[int], include_external_data: bool) -> tuple:
+        """Cached answers are only reused under the same system prompt, index and retrieval scope."""
+        system_prompt = self.conversation_obj.system_prompt
+        return (
+            (system_prompt.assistant_type, system_prompt.version) if system_prompt else None,
+            self.chunks.version,
+            course_id,
+            bool(include_external_data),
         )
 
-        return messages
+    def history_digest(self) -> str:
+        """Digest of the messages exchanged so far, the model's answer depends on them too."""
+        return hashlib.sha1(json.dumps(self.conversation).encode("utf-8")).hexdigest()
+
+    def reuse_answer(self, user_query: str, response: str, tags: dict, timings: QueryTimings) -> List[Message]:
+        """Records an answer produced elsewhere (cache, identical query) as this conversation's question and answer."""
+        user_message = self.add_message(
+            "user", user_query, {"user_query": user_query}, is_original_user_query=True
+        )
+        self.add_ai_response(user_message, response, "LOCAL")
+
+        assistant_message = self.add_message("assistant", response, tags)
+        if tags.get("out_of_context"):
+            assistant_message.is_out_of_context_message = True
+        elif tags.get("concept_explanation"):
+            assistant_message.is_answer = True
+            if tags.get('sentiment_score'):
+                assistant_message.sentiment = tags['sentiment_score']
+
+        self.save_metrics(0, assistant_message.is_out_of_context_message, timings)
+        return [user_message, assistant_message]
 
     def prepare_user_prompt(self, query: str, context: str, **kwargs) -> str:
         follow_ups = kwargs.get("follow_up_limit_remaining") - 1
@@ -219,7 +419,6 @@ class QuantumAssistantConversation(BaseConversation):
 
         tags = {
             "user_query": query,
-            "context": context,
             "follow_up_limit_remaining": follow_ups,
             "external_source_allowed": bool(kwargs.get('external_source_allowed', False))
         }
@@ -228,7 +427,7 @@ class QuantumAssistantConversation(BaseConversation):
     def prepare_system_prompt(
         self, query: str, relevant_chunks: List[Tuple[str, float]]
     ) -> Tuple[str, str]:
-        context = "\n".join([f"- {chunk}" for chunk, _ in relevant_chunks])
+        context = format_context(relevant_chunks)
 
         system_prompt = f"""
         <system>
@@ -300,28 +499,65 @@ class QuantumAssistantConversation(BaseConversation):
         """
         return system_prompt, context
 
-    def add_message(self, role: str, content: str, tags: dict) -> Message:
+    def rebuild_context(self, message: Message) -> Optional[str]:
+        """
+        The context sent with a user message, rebuilt from the chunk ids in
+        its entities, or None if they refer to another version of the index.
+        """
+        entities = message.entities or {}
+        if entities.get("index_version") != self.chunks.version:
+            logger.warning(
+                f"Message {message.id} was answered from index {entities.get('index_version')}, "
+                f"the chunk store is at {self.chunks.version}"
+            )
+            return None
+        return format_context(merge_blocks(self.chunks, [tuple(chunk) for chunk in entities.get("chunks", [])]))
+
+    def rebuild_user_prompt(self, message: Message) -> Optional[str]:
+        """The prompt sent to Claude for a user message, see `rebuild_context`."""
+        context = self.rebuild_context(message)
+        if context is None:
+            return None
+        internal_query, _ = self.prepare_user_prompt(
+            query=message.entities["user_query"],
+            context=context,
+            follow_up_limit_remaining=message.entities["follow_up_limit_remaining"] + 1,
+            external_source_allowed=message.entities["external_source_allowed"],
+        )
+        return internal_query
+
+    def add_message(
+        self, role: str, content: str, tags: dict, stored_content: Optional[str] = None, **fields
+    ) -> Message:
+        """
+        Adds a message to the history and buffers its row, saved at the next
+        `pending.flush()`. The row stores `stored_content` instead of
+        `content` when given, e.g. the user query instead of the whole prompt.
+        """
         super().add_message(role, content)
-        return Message.objects.create(
+        return self.pending.add(Message(
             conversation=self.conversation_obj,
-            content=content,
+            content=content if stored_content is None else stored_content,
             message_type=role.upper(),
             entities=tags,
-        )
-
-    def send_to_claude_api(self, system_prompt) -> Tuple[str, dict]:
-        response, tags = super().send_to_claude_api(system_prompt)
-
-        # Save the AI response
-        AIResponse.objects.create(
-            message=self.conversation_obj.messages.last(),
-            ai_type="CLAUDE",
+            **fields,
+        ))
+
+    def add_ai_response(self, message: Message, response: str, ai_type: str, **fields) -> AIResponse:
+        """Buffers the AIResponse row of the response to `message`."""
+        return self.pending.add(AIResponse(
+            message=message,
+            ai_type=ai_type,
             attempt_number=1,
             response_content=response,
             is_final_answer=True,
-        )
+            **fields,
+        ))
 
-        return response, tags
+    def out_of_context_response(self) -> Tuple[str, dict]:
+        """Local stand-in for a Claude reply flagging the query as out of context."""
+        response = "<out_of_context>\nTrue\n</out_of_context>"
+        return response, self.extract_tags(response)
 
     @classmethod
     def load_from_db(cls, conversation_id: str):
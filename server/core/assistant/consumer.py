@@ -3,7 +3,9 @@
 import json
 from channels.generic.websocket import WebsocketConsumer
 from channels.db import database_sync_to_async
+from core.serializer import MessageSerializer
 from .assistant import QuantumAssistantConversation
+from .serializer import AssistantSerializer
 
 class QuantumAssistantConsumer(WebsocketConsumer):
     
@@ -48,13 +50,28 @@ class QuantumAssistantConsumer(WebsocketConsumer):
 
     def receive(self, text_data):
         text_data_json = json.loads(text_data)
-        message = text_data_json['message']
-
-        # Process the message
-        response = self.process_message(message)
+        # Validated as AssistantView does, a bad course_id must not break the connection
+        serial = AssistantSerializer(data={
+            'query': text_data_json.get('message'),
+            'course_id': text_data_json.get('course_id'),
+        })
+        if not serial.is_valid():
+            self.send(text_data=json.dumps({
+                'type': 'assistant_error',
+                'errors': serial.errors,
+            }))
+            return
+
+        # Process the message, Claude's text is streamed to the socket meanwhile
+        messages = self.process_message(serial.validated_data['query'], serial.validated_data['course_id'])
+
+        # `message` holds the tags of the final response. Only the first and last
+        # message contain question and answer, as in AssistantView.
         packet = {
             'type': 'assistant_message',
-            'message': response
+            'message': messages[-1].entities,
+            'messages': MessageSerializer([messages[0], messages[-1]], many=True).data,
+            'message_ids': [msg.id for msg in messages],
         }
         # Send message to room group
         self.channel_layer.group_send(
@@ -71,8 +88,17 @@ class QuantumAssistantConsumer(WebsocketConsumer):
         # Send message to WebSocket
         self.send(text_data=json.dumps(event))
 
-    def process_message(self, message):
-        return self.conversation.process_query(message)
+    def process_message(self, message, course_id=None):
+        return self.conversation.process_query(message, course_id=course_id, on_text=self.send_delta)
+
+    def send_delta(self, iteration, text):
+        # Text of the answer as Claude writes it, without tags or follow-up questions.
+        # Each follow-up iteration starts a new response.
+        self.send(text_data=json.dumps({
+            'type': 'assistant_delta',
+            'iteration': iteration,
+            'text': text,
+        }))
 
     # Add a method for preemptive messaging (to be implemented in the future)
     def send_preemptive_message(self, message):
@@ -0,0 +1,77 @@
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, List
+
+from ..base.metrics import Counter, Histogram
+from ..models import Conversation, PerformanceMetric
+
+
+# Stages of QuantumAssistantConversation.process_query, summed over its iterations
+STAGES = ("embed", "search", "prompt", "llm_ttft", "llm_total", "parse", "db_write")
+
+STAGE_SECONDS = Histogram(
+    "assistant_stage_seconds",
+    "Time spent per assistant query in each pipeline stage",
+    ("stage", "prompt_version"),
+)
+QUERY_SECONDS = Histogram(
+    "assistant_query_seconds",
+    "End to end time of assistant queries",
+    ("prompt_version",),
+)
+LLM_TOKENS = Counter(
+    "assistant_llm_tokens_total",
+    "LLM tokens used by assistant queries, from the API usage block",
+    ("direction", "prompt_version"),
+)
+
+
+class QueryTimings:
+    """Per-stage wall time and token usage of one assistant query."""
+
+    def __init__(self, prompt_version: str):
+        self.prompt_version = prompt_version
+        self.started = time.perf_counter()
+        self.seconds: Dict[str, float] = defaultdict(float)
+        self.tokens: Dict[str, int] = defaultdict(int)
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += time.perf_counter() - started
+
+    def add(self, name: str, seconds: float):
+        self.seconds[name] += seconds
+
+    def add_tokens(self, input_tokens, output_tokens):
+        self.tokens["input"] += input_tokens or 0
+        self.tokens["output"] += output_tokens or 0
+
+    def performance_metrics(self, conversation: Conversation) -> List[PerformanceMetric]:
+        """Rows for the stages and token counts recorded so far."""
+        metrics = [
+            PerformanceMetric(conversation=conversation, metric_name=f"{stage}_seconds", metric_value=seconds)
+            for stage, seconds in self.seconds.items()
+        ]
+        metrics += [
+            PerformanceMetric(conversation=conversation, metric_name=f"{direction}_tokens", metric_value=count)
+            for direction, count in self.tokens.items()
+        ]
+        metrics.append(PerformanceMetric(
+            conversation=conversation,
+            metric_name="total_seconds",
+            metric_value=time.perf_counter() - self.started,
+        ))
+        return metrics
+
+    def observe(self):
+        """Exports the query on /metrics/, call once it is fully persisted."""
+        for stage, seconds in self.seconds.items():
+            STAGE_SECONDS.labels(stage=stage, prompt_version=self.prompt_version).observe(seconds)
+        for direction, count in self.tokens.items():
+            LLM_TOKENS.labels(direction=direction, prompt_version=self.prompt_version).inc(count)
+        QUERY_SECONDS.labels(prompt_version=self.prompt_version).observe(time.perf_counter() - self.started)
@@ -4,3 +4,5 @@ from rest_framework import serializers
 class AssistantSerializer(serializers.Serializer):
     query = serializers.CharField()
     include_external_data = serializers.BooleanField(default=False)
+    # Restricts retrieval to the learning objects of this course
+    course_id = serializers.IntegerField(required=False, allow_null=True, default=None)
@@ -15,7 +15,11 @@ class AssistantView(APIView):
 
         try:
             conversation = QuantumAssistantConversation(request.user, conversation_id)
-            messages = conversation.process_query(serial.validated_data['query'], serial.validated_data['include_external_data'])
+            messages = conversation.process_query(
+                serial.validated_data['query'],
+                serial.validated_data['include_external_data'],
+                serial.validated_data['course_id'],
+            )
 
             # Only first and last message actually container question and answer. 
             # Intermediate messages can be follow up questions.
@@ -0,0 +1,80 @@
+import os
+import threading
+from typing import Dict, Tuple
+
+import anthropic
+import httpx
+
+from .config import config
+
+
+def _timeout() -> httpx.Timeout:
+    return httpx.Timeout(
+        config["anthropic_timeout"],
+        connect=config["anthropic_connect_timeout"],
+        pool=config["anthropic_pool_timeout"],
+    )
+
+
+def _limits() -> httpx.Limits:
+    # Requests beyond `max_connections` wait (up to the pool timeout) for a free
+    # connection, which caps the number of concurrent calls per process.
+    return httpx.Limits(
+        max_connections=config["anthropic_max_concurrency"],
+        max_keepalive_connections=config["anthropic_pool_size"],
+    )
+
+
+def _client_options() -> dict:
+    return {
+        "api_key": config["anthropic_api_key"],
+        # None falls back to the ANTHROPIC_BASE_URL environment variable, then the public API
+        "base_url": config["anthropic_base_url"],
+        "timeout": _timeout(),
+        "max_retries": config["anthropic_max_retries"],
+    }
+
+
+_CLIENTS: Dict[str, Tuple[int, object]] = {}
+_CLIENTS_LOCK = threading.Lock()
+
+
+def _get_client(kind: str, create):
+    # Keyed on the pid as well, a connection pool must not be shared with forked workers.
+    pid = os.getpid()
+    entry = _CLIENTS.get(kind)
+    if entry is None or entry[0] != pid:
+        with _CLIENTS_LOCK:
+            entry = _CLIENTS.get(kind)
+            if entry is None or entry[0] != pid:
+                entry = _CLIENTS[kind] = (pid, create())
+    return entry[1]
+
+
+def get_anthropic_client() -> anthropic.Anthropic:
+    """
+    Returns the process wide Anthropic client. Its keep-alive connection pool
+    is shared by every conversation, so only the first request of a process
+    pays for the TCP and TLS handshakes.
+    """
+    return _get_client(
+        "sync",
+        lambda: anthropic.Anthropic(
+            http_client=anthropic.DefaultHttpxClient(limits=_limits(), timeout=_timeout()),
+            **_client_options(),
+        ),
+    )
+
+
+def get_async_anthropic_client() -> anthropic.AsyncAnthropic:
+    """
+    Async variant of `get_anthropic_client`. The client must only be used from
+    the event loop it was first used on (one per ASGI worker).
+    """
+    return _get_client(
+        "async",
+        lambda: anthropic.AsyncAnthropic(
+            http_client=anthropic.DefaultAsyncHttpxClient(limits=_limits(), timeout=_timeout()),
+            **_client_options(),
+        ),
+    )
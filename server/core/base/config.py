@@ -6,20 +6,56 @@ dotenv.load_dotenv('.env')
 
 
 config = {
-    "database": os.getenv('database'),  # Options: "faiss" or "pinecone"
+    "database": os.getenv('database'),  # Legacy, prefer "vector_store"
     "model_name": "sentence-transformers/all-MiniLM-L6-v2",
+    "embedding_backend": os.getenv('embedding_backend', 'torch'),  # Options: "torch", "onnx" or "onnx-int8"
+    "embedding_onnx_dir": os.getenv('embedding_onnx_dir', 'onnx_models'),
+    "embedding_workers": int(os.getenv('embedding_workers', 0)),  # 0 embeds inline
+    "embedding_torch_threads": int(os.getenv('embedding_torch_threads', 1)),
     "dimension": 384,  # Dimension of the chosen model
     "top_k": 5,
     "pinecone_api_key": os.getenv('pinecone_api_key'),
     "pinecone_environment": "your-pinecone-environment",
     "pinecone_index_name": "textbook-chunks",
-    "faiss_index_file": "faiss_index.bin",
-    "chunks_file": "text_chunks.json",
+    "vector_store": os.getenv('vector_store', {"faiss": "faiss-flat"}.get(os.getenv('database'), os.getenv('database'))),  # Options: "numpy", "faiss-flat", "faiss-hnsw" or "pinecone"
+    "vector_store_path": os.getenv('vector_store_path', "vector_index.bin"),
+    "hnsw_m": int(os.getenv('hnsw_m', 32)),
+    "hnsw_ef_construction": int(os.getenv('hnsw_ef_construction', 40)),
+    "hnsw_ef_search": int(os.getenv('hnsw_ef_search', 16)),
+    "chunks_file": "text_chunks.json",  # Legacy JSON chunks, converted into the chunk store by the indexer
+    "chunk_store_path": os.getenv('chunk_store_path', "chunks"),
     "notebook_directory": os.getenv('notebook_directory'),
     "chunk_size": 3,  # Number of sentences per chunk
     "anthropic_api_key": os.getenv('anthropic_key'),
     "anthropic_model": os.getenv('anthropic_model'),
+    "anthropic_base_url": os.getenv('anthropic_base_url'),  # e.g. a local stub server
+    "anthropic_timeout": float(os.getenv('anthropic_timeout', 60)),  # Seconds, per read/write
+    "anthropic_connect_timeout": float(os.getenv('anthropic_connect_timeout', 5)),
+    "anthropic_pool_timeout": float(os.getenv('anthropic_pool_timeout', 30)),  # Wait for a free connection
+    "anthropic_pool_size": int(os.getenv('anthropic_pool_size', 10)),  # Idle keep-alive connections
+    "anthropic_max_concurrency": int(os.getenv('anthropic_max_concurrency', 20)),  # Open connections per process
+    "anthropic_max_retries": int(os.getenv('anthropic_max_retries', 2)),
+    "llm_backend": os.getenv('llm_backend', 'anthropic'),  # Options: "anthropic" or "fake" (offline benchmarking)
+    "llm_fake_script": os.getenv('llm_fake_script', 'answer'),  # Comma separated: answer, insufficient_data, out_of_context
+    "llm_fake_latency_ms": float(os.getenv('llm_fake_latency_ms', 0)),  # Before the first token
+    "llm_fake_chunk_size": int(os.getenv('llm_fake_chunk_size', 16)),  # Characters per streamed chunk
+    "llm_fake_chunk_interval_ms": float(os.getenv('llm_fake_chunk_interval_ms', 0)),
     "max_follow_up_limit": int(os.getenv("max_follow_up_questions", 3)),
     'notebook_json_path': os.getenv('notebook_json_path'),
     'cell_json_path': os.getenv('cell_json_path')
 }
+
+
+def _vector_store_options():
+    if config["vector_store"] == "pinecone":
+        return {"api_key": config["pinecone_api_key"], "index_name": config["pinecone_index_name"]}
+    elif config["vector_store"] == "faiss-hnsw":
+        return {
+            "m": config["hnsw_m"],
+            "ef_construction": config["hnsw_ef_construction"],
+            "ef_search": config["hnsw_ef_search"],
+        }
+    return {}
+
+
+config["vector_store_options"] = _vector_store_options()
@@ -1,23 +1,38 @@
-import re
-
 import anthropic
+import time
 from abc import ABC, abstractmethod
-from typing import List, Tuple, Optional, Dict
+from dataclasses import dataclass
+from typing import Callable, List, Tuple, Optional, Dict
 import uuid
 
-from ..base.config import config
+from ..base.llm import LLMBackend, LLMResponse, get_llm_backend
+from ..base.tag_parser import CLOSE, TEXT, TagParser, parse_tags
+
+
+@dataclass
+class LLMCall:
+    """Timings (seconds) and response of the last `send_to_claude_api` call."""
+    response: LLMResponse
+    first_token_seconds: Optional[float]
+    total_seconds: float
+    parse_seconds: float
 
 
 class Conversation(ABC):
     # Define the tags we're looking for in API response
     response_tags = []
+    # Tags that settle the response: generation is aborted as soon as one closes
+    stop_tags = []
+    # Tags whose text is passed to `on_text` of `send_to_claude_api` as it streams in
+    streamed_tags = []
     debug_print = True
 
-    def __init__(self, conversation_id: Optional[str] = None):
+    def __init__(self, conversation_id: Optional[str] = None, llm: Optional[LLMBackend] = None):
         # self.conversation_id = conversation_id or str(uuid.uuid4())
         self.conversation: List[Dict[str, str]] = []
-        self.api_key = config['anthropic_api_key']
-        self.anthropic_client = anthropic.Anthropic(api_key=self.api_key)
+        # Defaults to the backend chosen by config["llm_backend"]
+        self.llm = llm or get_llm_backend()
+        self.last_call: Optional[LLMCall] = None
 
     @abstractmethod
     def process_query(self, query: str) -> str:
@@ -43,14 +58,46 @@ class Conversation(ABC):
     def load_from_db(cls, conversation_id: str):
         pass
 
-    def send_to_claude_api(self, system_prompt) -> Tuple[str, Dict[str, str]]:
+    def send_to_claude_api(
+        self, system_prompt, on_text: Optional[Callable[[str], None]] = None
+    ) -> Tuple[str, Dict[str, str]]:
+        """
+        Sends the conversation to the LLM backend (Claude unless configured
+        otherwise) and returns the response text and its tags. With `on_text`,
+        the text of `streamed_tags` is passed to `on_text` as it arrives,
+        without the markup and the other tags.
+
+        The response is always streamed through a `TagParser`, so tags are
+        parsed as they arrive and the generation stops once a `stop_tags`
+        tag is closed. Timings and token usage are left in `self.last_call`.
+        """
         response = None
+        parser = TagParser(self.response_tags)
+        started = time.perf_counter()
+        first_token_seconds = None
+        parse_seconds = 0.0
+
+        def on_delta(text: str) -> bool:
+            nonlocal first_token_seconds, parse_seconds
+            if first_token_seconds is None:
+                first_token_seconds = time.perf_counter() - started
+
+            parse_started = time.perf_counter()
+            events = parser.feed(text)
+            parse_seconds += time.perf_counter() - parse_started
+
+            if on_text is not None:
+                for event in events:
+                    if event.kind == TEXT and event.tag in self.streamed_tags:
+                        on_text(event.text)
+            return any(event.kind == CLOSE and event.tag in self.stop_tags for event in events)
+
         try:
-            response = self.anthropic_client.messages.create(
-                model=config['anthropic_model'],
+            response = self.llm.complete(
                 system=system_prompt,
+                messages=self.conversation,
                 max_tokens=1000,
-                messages=self.conversation
+                on_text=on_delta,
             )
         except anthropic.AnthropicError as e:
             print("AnthropicError in anthropic API", e)
@@ -62,6 +109,8 @@ class Conversation(ABC):
         if response is None:
             raise Exception("Internal Error")
 
+        self.last_call = LLMCall(response, first_token_seconds, time.perf_counter() - started, parse_seconds)
+
         try:
             # Extract Claude's response
             if self.debug_print:
@@ -69,8 +118,8 @@ class Conversation(ABC):
                 print("Raw Response\n", response)
                 print('----------------------------------------\n\n')
 
-            claude_response = response.content[0].text
-            tags = self.extract_tags(claude_response)
+            claude_response = response.text
+            tags = parser.tags
             if self.debug_print:
                 print('\n\n-------------- Extracted Tags from API --------------------------')
                 print("Extracted Tags\n", tags)
@@ -84,17 +133,4 @@ class Conversation(ABC):
             raise Exception("Internal Error")
 
     def extract_tags(self, response: str) -> Dict[str, str]:
-
-        # Initialize the result dictionary
-        result = {}
-
-        # Extract content for each tag
-        for tag in self.response_tags:
-            pattern = f"<{tag}>(.*?)</{tag}>"
-            match = re.search(pattern, response, re.DOTALL | re.IGNORECASE)
-            if match:
-                # Strip leading/trailing whitespace and remove extra newlines
-                content = re.sub(r'\n+', '\n', match.group(1).strip())
-                result[tag] = content
-
-        return result
+        return parse_tags(response, self.response_tags)
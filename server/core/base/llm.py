@@ -0,0 +1,177 @@
+import itertools
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence
+
+from .anthropic_client import get_anthropic_client
+from .config import config
+
+
+# stop_reason of a response aborted by its on_text callback
+STOPPED = "stopped"
+
+@dataclass
+class LLMResponse:
+    text: str
+    input_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
+    stop_reason: Optional[str] = None
+
+
+class LLMBackend(ABC):
+    """Generates the assistant's next message for a conversation."""
+
+    @abstractmethod
+    def complete(
+        self,
+        system: str,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        on_text: Optional[Callable[[str], None]] = None,
+    ) -> LLMResponse:
+        """
+        Returns the response to `messages`. With `on_text`, the response is
+        streamed and each text delta is passed to `on_text` as it arrives; when
+        `on_text` returns True the generation is aborted and the text received
+        so far is returned (with stop_reason STOPPED).
+        """
+
+
+class AnthropicBackend(LLMBackend):
+    def __init__(self, model: Optional[str] = None, client=None):
+        self.model = model or config["anthropic_model"]
+        self.client = client or get_anthropic_client()
+
+    def complete(self, system, messages, max_tokens, on_text=None) -> LLMResponse:
+        request = dict(model=self.model, system=system, max_tokens=max_tokens, messages=messages)
+        if on_text is None:
+            response = self.client.messages.create(**request)
+        else:
+            with self.client.messages.stream(**request) as stream:
+                for text in stream.text_stream:
+                    if on_text(text):
+                        # Leaving the block closes the connection, which ends the generation
+                        snapshot = stream.current_message_snapshot
+                        return LLMResponse(
+                            text=snapshot.content[0].text,
+                            input_tokens=snapshot.usage.input_tokens,
+                            output_tokens=snapshot.usage.output_tokens,
+                            stop_reason=STOPPED,
+                        )
+                response = stream.get_final_message()
+
+        return LLMResponse(
+            text=response.content[0].text,
+            input_tokens=response.usage.input_tokens,
+            output_tokens=response.usage.output_tokens,
+            stop_reason=response.stop_reason,
+        )
+
+
+FAKE_RESPONSES = {
+    "answer": (
+        "<concept_explanation>\n"
+        "According to the curriculum, a qubit is the basic unit of quantum information. "
+        "Unlike a classical bit it can be in a superposition of the states |0> and |1>, "
+        "and measuring it yields 0 or 1 with probabilities given by its amplitudes.\n"
+        "</concept_explanation>\n"
+        "<internal_sources>\n"
+        "- A qubit can be in a superposition of |0> and |1>.\n"
+        "</internal_sources>\n"
+        "<sentiment_score>\n0.9\n</sentiment_score>"
+    ),
+    "insufficient_data": (
+        "<insufficient_data>\n"
+        "- What is a superposition of quantum states?\n"
+        "- How are measurement probabilities computed from amplitudes?\n"
+        "</insufficient_data>"
+    ),
+    "out_of_context": "<out_of_context>\nTrue\n</out_of_context>",
+}
+
+
+class FakeLLMBackend(LLMBackend):
+    """
+    Deterministic local stand-in for Claude, for benchmarking and profiling
+    the pipeline without network access or an API key.
+
+    Calls return the responses of `script` in turn (cycling), each either a
+    `FAKE_RESPONSES` name or literal tagged text. A call waits `latency_ms`
+    before the first token, then emits the text `chunk_size` characters at
+    a time, `chunk_interval_ms` apart, whether it is streamed or not.
+    """
+
+    def __init__(
+        self,
+        script: Sequence[str] = ("answer",),
+        latency_ms: float = 0,
+        chunk_size: int = 16,
+        chunk_interval_ms: float = 0,
+    ):
+        if not script:
+            raise ValueError("The fake LLM script needs at least one response")
+        self.script = [FAKE_RESPONSES.get(response, response) for response in script]
+        self.latency_ms = latency_ms
+        self.chunk_size = chunk_size
+        self.chunk_interval_ms = chunk_interval_ms
+        self._responses = itertools.cycle(self.script)
+        self._lock = threading.Lock()
+
+    def complete(self, system, messages, max_tokens, on_text=None) -> LLMResponse:
+        with self._lock:
+            text = next(self._responses)
+
+        stop_reason = "end_turn"
+        time.sleep(self.latency_ms / 1000)
+        for start in range(0, len(text), self.chunk_size):
+            if start:
+                time.sleep(self.chunk_interval_ms / 1000)
+            if on_text is not None and on_text(text[start:start + self.chunk_size]):
+                text, stop_reason = text[:start + self.chunk_size], STOPPED
+                break
+
+        # Rough whitespace token counts, stable across runs
+        prompt = system + "".join(message["content"] for message in messages)
+        return LLMResponse(
+            text=text,
+            input_tokens=len(prompt.split()),
+            output_tokens=len(text.split()),
+            stop_reason=stop_reason,
+        )
+
+
+LLM_BACKENDS = {
+    "anthropic": AnthropicBackend,
+    "fake": FakeLLMBackend,
+}
+
+_BACKEND = None
+_BACKEND_LOCK = threading.Lock()
+
+
+def _fake_options() -> dict:
+    return {
+        "script": [response.strip() for response in config["llm_fake_script"].split(",")],
+        "latency_ms": config["llm_fake_latency_ms"],
+        "chunk_size": config["llm_fake_chunk_size"],
+        "chunk_interval_ms": config["llm_fake_chunk_interval_ms"],
+    }
+
+
+def create_llm_backend(backend: str, **options) -> LLMBackend:
+    if backend not in LLM_BACKENDS:
+        raise ValueError(f"Unknown LLM backend {backend!r}, expected one of {', '.join(LLM_BACKENDS)}")
+    return LLM_BACKENDS[backend](**options)
+
+
+def get_llm_backend() -> LLMBackend:
+    """Returns the process wide backend selected by config["llm_backend"]."""
+    global _BACKEND
+    if _BACKEND is None:
+        with _BACKEND_LOCK:
+            if _BACKEND is None:
+                backend = config["llm_backend"]
+                _BACKEND = create_llm_backend(backend, **(_fake_options() if backend == "fake" else {}))
+    return _BACKEND
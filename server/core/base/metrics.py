@@ -0,0 +1,155 @@
+import bisect
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, List, Sequence, Tuple
+
+
+# Seconds. Covers sub-millisecond cache hits up to multi-second LLM calls.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class _HistogramValue:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.bucket_counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.bucket_counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            counts = list(self.bucket_counts)
+            count, total = self.count, self.sum
+
+        cumulative, running = [], 0
+        for bound, bucket_count in zip(list(self.buckets) + [float("inf")], counts):
+            running += bucket_count
+            cumulative.append((bound, running))
+        return {"buckets": cumulative, "count": count, "sum": total}
+
+
+class _CounterValue:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+    def snapshot(self) -> Dict:
+        return {"value": self.value}
+
+
+class _Metric(ABC):
+    type_name = None
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        register(self)
+
+    @abstractmethod
+    def _new_value(self):
+        """The value of one label combination."""
+        pass
+
+    def labels(self, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        value = self._values.get(key)
+        if value is None:
+            with self._lock:
+                value = self._values.setdefault(key, self._new_value())
+        return value
+
+    def _default(self):
+        if self.labelnames:
+            raise ValueError(f"Metric {self.name} requires labels {self.labelnames}")
+        return self.labels()
+
+    def samples(self) -> List[Tuple[Dict[str, str], Dict]]:
+        with self._lock:
+            items = list(self._values.items())
+        return [(dict(zip(self.labelnames, key)), value.snapshot()) for key, value in items]
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames)
+
+    def _new_value(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self._default().observe(value)
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def _new_value(self):
+        return _CounterValue()
+
+    def inc(self, amount: float = 1):
+        self._default().inc(amount)
+
+
+_REGISTRY: Dict[str, _Metric] = {}
+_REGISTRY_LOCK = threading.Lock()
+
+
+def register(metric: _Metric):
+    with _REGISTRY_LOCK:
+        if metric.name in _REGISTRY:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        _REGISTRY[metric.name] = metric
+
+
+def get_registered_metrics() -> List[_Metric]:
+    with _REGISTRY_LOCK:
+        return list(_REGISTRY.values())
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(key, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for key, value in labels.items()
+    )
+    return "{" + pairs + "}"
+
+
+def _format_bound(bound: float) -> str:
+    return "+Inf" if bound == float("inf") else repr(float(bound))
+
+
+def render_prometheus() -> str:
+    """Renders every registered metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in get_registered_metrics():
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.type_name}")
+        for labels, snapshot in metric.samples():
+            if metric.type_name == "histogram":
+                for bound, count in snapshot["buckets"]:
+                    bucket_labels = dict(labels, le=_format_bound(bound))
+                    lines.append(f"{metric.name}_bucket{_format_labels(bucket_labels)} {count}")
+                lines.append(f"{metric.name}_sum{_format_labels(labels)} {snapshot['sum']}")
+                lines.append(f"{metric.name}_count{_format_labels(labels)} {snapshot['count']}")
+            else:
+                lines.append(f"{metric.name}{_format_labels(labels)} {snapshot['value']}")
+    return "\n".join(lines) + "\n"
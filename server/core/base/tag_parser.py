@@ -0,0 +1,99 @@
+import re
+from dataclasses import dataclass
+from typing import Dict, Iterable, List
+
+
+OPEN = "open"
+TEXT = "text"
+CLOSE = "close"
+
+
+@dataclass
+class TagEvent:
+    kind: str  # OPEN, TEXT or CLOSE
+    tag: str
+    text: str = ""
+
+
+class TagParser:
+    """
+    Incremental, single pass parser for the `<tag>...</tag>` blocks of an
+    LLM response.
+
+    `feed` takes the response in arbitrary chunks (as it streams in) and
+    returns the events completed by that chunk; tag names are matched case
+    insensitively and other markup is left in the content. `tags` gives the
+    same result as the former per-tag regex `<tag>(.*?)</tag>`: each tag is
+    parsed independently of the others, so tags may nest or overlap and a
+    tag that is never closed does not hide the ones after it. The first
+    closed occurrence of a tag wins, its content stripped with repeated
+    newlines collapsed.
+
+    TEXT events carry the text outside of any known tag's markup, once for
+    every tag open at that point.
+    """
+
+    def __init__(self, tags: Iterable[str]):
+        self.names = {tag.lower(): tag for tag in tags}
+        # "<name>" and "</name>" of every tag, lower cased -> (closing, tag)
+        self._markups = {}
+        for name, tag in self.names.items():
+            self._markups[f"<{name}>"] = (False, tag)
+            self._markups[f"</{name}>"] = (True, tag)
+        self._max_markup = max((len(markup) for markup in self._markups), default=0)
+        self._buffer = ""
+        # Content so far of every tag opened and not closed yet
+        self._open: Dict[str, List[str]] = {}
+        self._closed: Dict[str, str] = {}
+
+    @property
+    def tags(self) -> Dict[str, str]:
+        return {tag: self._closed[tag] for tag in self.names.values() if tag in self._closed}
+
+    def feed(self, text: str) -> List[TagEvent]:
+        events = []
+        self._buffer += text
+        while self._buffer:
+            start = self._buffer.find("<")
+            if start == -1:
+                self._text(events, self._buffer)
+                self._buffer = ""
+                break
+            self._text(events, self._buffer[:start])
+            self._buffer = self._buffer[start:]
+
+            head = self._buffer[:self._max_markup].lower()
+            markup = next((markup for markup in self._markups if head.startswith(markup)), None)
+            if markup is None:
+                if len(head) < self._max_markup and any(markup.startswith(head) for markup in self._markups):
+                    # Keep a "<" that may still become a known tag once more text arrives
+                    break
+                self._text(events, "<")
+                self._buffer = self._buffer[1:]
+                continue
+
+            raw, self._buffer = self._buffer[:len(markup)], self._buffer[len(markup):]
+            closing, tag = self._markups[markup]
+            if closing and tag in self._open:
+                content = self._open.pop(tag)
+                self._closed[tag] = re.sub(r"\n+", "\n", "".join(content).strip())
+                events.append(TagEvent(CLOSE, tag))
+            for content in self._open.values():
+                content.append(raw)
+            if not closing and tag not in self._open and tag not in self._closed:
+                self._open[tag] = []
+                events.append(TagEvent(OPEN, tag))
+        return events
+
+    def _text(self, events: List[TagEvent], text: str):
+        if not text:
+            return
+        for tag, content in self._open.items():
+            content.append(text)
+            events.append(TagEvent(TEXT, tag, text))
+
+
+def parse_tags(response: str, tags: Iterable[str]) -> Dict[str, str]:
+    parser = TagParser(tags)
+    parser.feed(response)
+    return parser.tags
@@ -0,0 +1,128 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from functools import partial
+from typing import List
+
+import numpy as np
+
+from ..base.metrics import Histogram
+
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = Histogram(
+    "embedding_batch_size",
+    "Number of texts embedded per forward pass",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+QUEUE_WAIT = Histogram(
+    "embedding_queue_wait_seconds",
+    "Time a text waited in the batching queue before its forward pass started",
+)
+
+
+class BatchingEmbedder:
+    """
+    Coalesces concurrent `create_embedding` calls into padded batches.
+
+    The first queued text opens a window of `window_ms`; everything that
+    arrives before it closes (up to `max_batch_size` texts) goes through the
+    underlying embedder (an engine or an `EmbeddingClient`) in a single
+    forward pass, and every caller gets back its own row.
+
+    Embedders with a non-blocking `submit` (an `EmbeddingClient` backed by
+    worker processes) get up to their `concurrency` batches at once; while
+    they are all busy, texts keep queueing and make up the next batch.
+    """
+
+    def __init__(self, embedder, window_ms: float = 5, max_batch_size: int = 32):
+        self.embedder = embedder
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self._slots = threading.Semaphore(getattr(embedder, "concurrency", 1))
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        with self._worker_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._run, name=f"embedding-batcher-{self.embedder.model_name}", daemon=True
+                )
+                self._worker.start()
+
+    def submit(self, text: str) -> Future:
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((text, future, time.perf_counter()))
+        return future
+
+    def create_embedding(self, text: str) -> np.ndarray:
+        return self.submit(text).result()
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        futures = [self.submit(text) for text in texts]
+        return np.stack([future.result() for future in futures])
+
+    def _collect_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        submit = getattr(self.embedder, "submit", None)
+        while True:
+            # Wait for a free slot first, so the batch grows while every slot is busy.
+            self._slots.acquire()
+            batch = self._collect_batch()
+            started = time.perf_counter()
+            for _, _, enqueued in batch:
+                QUEUE_WAIT.observe(started - enqueued)
+            BATCH_SIZE.observe(len(batch))
+
+            texts = [text for text, _, _ in batch]
+            if submit is None:
+                result = Future()
+                try:
+                    result.set_result(self.embedder.embed(texts))
+                except Exception as e:
+                    result.set_exception(e)
+                self._resolve(batch, result)
+                continue
+
+            try:
+                result = submit(texts)
+            except Exception as e:
+                result = Future()
+                result.set_exception(e)
+                self._resolve(batch, result)
+                continue
+            result.add_done_callback(partial(self._resolve, batch))
+
+    def _resolve(self, batch, result: Future):
+        """Hands each caller its row of the batch `result`, and frees the batch's slot."""
+        self._slots.release()
+        try:
+            vectors = result.result()
+        except BaseException as e:  # CancelledError too, when the pool shuts down
+            logger.error("Embedding batch failed", exc_info=e)
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+
+        for (_, future, _), vector in zip(batch, vectors):
+            future.set_result(vector)
@@ -0,0 +1,121 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+
+from ..base.metrics import Counter
+
+
+CACHE_HITS = Counter("embedding_cache_hits_total", "Query embeddings served from the cache")
+CACHE_MISSES = Counter("embedding_cache_misses_total", "Query embeddings that had to be computed")
+
+
+def normalize_text(text: str) -> str:
+    """Collapses whitespace and case so trivially different spellings of a query share an entry."""
+    return " ".join(text.split()).lower()
+
+
+class EmbeddingCache:
+    """
+    Bounded LRU cache of embeddings with a TTL.
+
+    Entries are keyed by model name and the normalized text, so switching
+    `MODEL_NAME` never serves vectors produced by another model. With
+    `backend="django"` the entries are stored in a Django cache (e.g. Redis or
+    Memcached) so that every worker process shares them; eviction is then left
+    to that cache and `max_size` is ignored.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        max_size: int = 1024,
+        ttl: float = 3600,
+        backend: str = "local",
+        cache_alias: str = "default",
+    ):
+        if backend not in ("local", "django"):
+            raise ValueError("Invalid embedding cache backend. Use 'local' or 'django'.")
+
+        self.model_name = model_name
+        self.max_size = max_size
+        self.ttl = ttl
+        self.backend = backend
+        self.cache_alias = cache_alias
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def make_key(self, text: str) -> str:
+        digest = hashlib.sha1(normalize_text(text).encode("utf-8")).hexdigest()
+        return f"embedding:{self.model_name}:{digest}"
+
+    def _django_cache(self):
+        from django.core.cache import caches
+
+        return caches[self.cache_alias]
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        key = self.make_key(text)
+        if self.backend == "django":
+            value = self._django_cache().get(key)
+            vector = None if value is None else np.frombuffer(value, dtype=np.float32).copy()
+        else:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry[1] < time.monotonic():
+                    del self._entries[key]
+                    entry = None
+                if entry is not None:
+                    self._entries.move_to_end(key)
+            vector = None if entry is None else entry[0]
+
+        if vector is None:
+            CACHE_MISSES.inc()
+        else:
+            CACHE_HITS.inc()
+        return vector
+
+    def set(self, text: str, vector: np.ndarray):
+        key = self.make_key(text)
+        vector = np.asarray(vector, dtype=np.float32)
+        if self.backend == "django":
+            self._django_cache().set(key, vector.tobytes(), timeout=self.ttl)
+            return
+
+        with self._lock:
+            self._entries[key] = (vector, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class CachedEmbedder:
+    """Puts an `EmbeddingCache` in front of any embedder exposing `embed`/`create_embedding`."""
+
+    def __init__(self, embedder, cache: EmbeddingCache):
+        self.embedder = embedder
+        self.cache = cache
+
+    def create_embedding(self, text: str) -> np.ndarray:
+        vector = self.cache.get(text)
+        if vector is None:
+            vector = self.embedder.create_embedding(text)
+            self.cache.set(text, vector)
+        return vector
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = [self.cache.get(text) for text in texts]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            computed = self.embedder.embed([texts[i] for i in missing])
+            for i, vector in zip(missing, computed):
+                self.cache.set(texts[i], vector)
+                vectors[i] = vector
+        return np.stack(vectors)
@@ -0,0 +1,115 @@
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from ..base.metrics import Histogram
+from .engine import get_embedding_engine
+
+
+EMBEDDING_REQUEST = Histogram(
+    "embedding_request_seconds",
+    "Wall time of an embedding request as seen by the caller",
+    labelnames=("mode",),
+)
+
+
+class EmbeddingClient:
+    """
+    Small API through which the assistant, peer and indexer obtain embeddings.
+
+    With `workers=0` texts are embedded inline with the process wide engine;
+    otherwise they are sent to an `EmbeddingWorkerPool` and the calling thread
+    only waits for the result. `submit` does not wait at all in that case, so
+    up to `concurrency` batches can be in flight at once.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        backend: str = "torch",
+        workers: int = 0,
+        num_threads: int = 1,
+        **options,
+    ):
+        self.model_name = model_name
+        self.backend = backend
+        self.mode = "pool" if workers else "inline"
+        if workers:
+            from .pool import EmbeddingWorkerPool
+
+            self._target = EmbeddingWorkerPool(
+                model_name, backend, workers=workers, num_threads=num_threads, **options
+            )
+        else:
+            self._target = get_embedding_engine(model_name, backend, **options)
+
+    @property
+    def identifier(self) -> str:
+        if self.backend == "torch":
+            return self.model_name
+        return f"{self.model_name}:{self.backend}"
+
+    @property
+    def concurrency(self) -> int:
+        """Number of batches that are embedded in parallel."""
+        return self._target.workers if self.mode == "pool" else 1
+
+    def submit(self, texts: List[str]) -> Future:
+        """Starts embedding `texts` and returns the future of their vectors. Runs inline without workers."""
+        started = time.perf_counter()
+        if self.mode == "pool":
+            future = self._target.submit(texts)
+        else:
+            future = Future()
+            try:
+                future.set_result(self._target.embed(texts))
+            except Exception as e:
+                future.set_exception(e)
+        future.add_done_callback(
+            lambda _: EMBEDDING_REQUEST.labels(mode=self.mode).observe(time.perf_counter() - started)
+        )
+        return future
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        return self.submit(texts).result()
+
+    def create_embedding(self, text: str) -> np.ndarray:
+        return self.embed([text])[0]
+
+    def embed_in_batches(self, texts: List[str], batch_size: int = 64) -> np.ndarray:
+        """Embeds a large list (e.g. while indexing) in bounded batches."""
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.concatenate(
+            [self.embed(texts[i:i + batch_size]) for i in range(0, len(texts), batch_size)]
+        )
+
+    def warm_up(self):
+        if self.mode == "pool":
+            self._target.warm_up()
+        else:
+            self._target.load()
+        self.create_embedding("warm up")
+
+
+_CLIENTS: Dict[Tuple, EmbeddingClient] = {}
+_CLIENTS_LOCK = threading.Lock()
+
+
+def get_embedding_client(
+    model_name: str, backend: str = "torch", workers: int = 0, num_threads: int = 1, **options
+) -> EmbeddingClient:
+    """Returns the process wide client for this configuration, creating it on first call."""
+    key = (model_name, backend, workers, num_threads, tuple(sorted(options.items())))
+    client = _CLIENTS.get(key)
+    if client is None:
+        with _CLIENTS_LOCK:
+            client = _CLIENTS.get(key)
+            if client is None:
+                client = _CLIENTS[key] = EmbeddingClient(
+                    model_name, backend, workers=workers, num_threads=num_threads, **options
+                )
+    return client
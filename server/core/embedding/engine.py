@@ -0,0 +1,134 @@
+import logging
+import os
+import threading
+from typing import Dict, List, Tuple
+
+import numpy as np
+import torch
+from transformers import AutoTokenizer, AutoModel
+
+
+logger = logging.getLogger(__name__)
+
+# Set OpenMP environment variable to ignore duplicate library error
+os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
+os.environ["TOKENIZERS_PARALLELISM"] = "false"
+
+
+def mean_pool(last_hidden_state: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+    mask = attention_mask[..., np.newaxis].astype(last_hidden_state.dtype)
+    summed = (last_hidden_state * mask).sum(axis=1)
+    return summed / np.clip(mask.sum(axis=1), 1e-9, None)
+
+
+class EmbeddingEngine:
+    """
+    Sentence embedding model shared by every conversation in a worker process.
+
+    The tokenizer and model are loaded lazily on first use (or on `load()`),
+    exactly once, and all forward passes are serialized through a lock since
+    the fast tokenizer is not safe to call from several threads at once.
+    """
+
+    backend = "torch"
+    max_length = 512
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self.tokenizer = None
+        self.model = None
+        self._load_lock = threading.Lock()
+        self._run_lock = threading.Lock()
+
+    @property
+    def identifier(self) -> str:
+        """Identifies the vectors this engine produces, e.g. for cache keys."""
+        if self.backend == "torch":
+            return self.model_name
+        return f"{self.model_name}:{self.backend}"
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.model is not None
+
+    def load(self) -> "EmbeddingEngine":
+        if self.is_loaded:
+            return self
+
+        with self._load_lock:
+            if not self.is_loaded:
+                logger.info(f"Loading embedding model: {self.model_name} ({self.backend})")
+                self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+                self.model = self._load_model()
+        return self
+
+    def _load_model(self):
+        model = AutoModel.from_pretrained(self.model_name)
+        model.eval()
+        return model
+
+    def _forward(self, texts: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns the last hidden state and the attention mask for `texts`."""
+        inputs = self.tokenizer(
+            texts,
+            return_tensors="pt",
+            padding=True,
+            truncation=True,
+            max_length=self.max_length,
+        )
+        with torch.inference_mode():
+            outputs = self.model(**inputs)
+        return outputs.last_hidden_state.numpy(), inputs["attention_mask"].numpy()
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """
+        Embeds a batch of texts in one padded forward pass.
+
+        Token embeddings are mean pooled over the attention mask, so a text
+        gets the same vector whether it is embedded alone or in a batch.
+        """
+        self.load()
+        with self._run_lock:
+            last_hidden_state, attention_mask = self._forward(texts)
+        return mean_pool(last_hidden_state, attention_mask)
+
+    def create_embedding(self, text: str) -> np.ndarray:
+        return self.embed([text])[0]
+
+
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx-int8")
+
+_ENGINES: Dict[Tuple[str, str], EmbeddingEngine] = {}
+_ENGINES_LOCK = threading.Lock()
+
+
+def _create_engine(model_name: str, backend: str, **options) -> EmbeddingEngine:
+    if backend == "torch":
+        return EmbeddingEngine(model_name)
+    elif backend in ("onnx", "onnx-int8"):
+        # ONNX Runtime is optional, only import it when selected.
+        from .onnx_engine import OnnxEmbeddingEngine
+
+        return OnnxEmbeddingEngine(model_name, quantize=backend == "onnx-int8", **options)
+    else:
+        raise ValueError(f"Invalid embedding backend '{backend}'. Use one of {EMBEDDING_BACKENDS}.")
+
+
+def get_embedding_engine(model_name: str, backend: str = "torch", **options) -> EmbeddingEngine:
+    """Returns the process wide engine for `model_name` and `backend`, creating it on first call."""
+    key = (model_name, backend)
+    engine = _ENGINES.get(key)
+    if engine is None:
+        with _ENGINES_LOCK:
+            engine = _ENGINES.get(key)
+            if engine is None:
+                engine = _ENGINES[key] = _create_engine(model_name, backend, **options)
+    return engine
+
+
+def warm_up_embedding_engine(model_name: str, backend: str = "torch", **options) -> EmbeddingEngine:
+    """Loads the model and runs one forward pass so the first user query does not pay for it."""
+    engine = get_embedding_engine(model_name, backend, **options).load()
+    engine.create_embedding("warm up")
+    logger.info(f"Embedding engine warmed up: {engine.identifier}")
+    return engine
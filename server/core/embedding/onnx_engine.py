@@ -0,0 +1,111 @@
+import logging
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+import onnxruntime
+import torch
+from transformers import AutoModel
+
+from .engine import EmbeddingEngine
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EXPORT_DIR = "onnx_models"
+ONNX_OPSET = 14
+
+
+class OnnxEmbeddingEngine(EmbeddingEngine):
+    """
+    Serves the embedding model through ONNX Runtime on CPU.
+
+    The model is exported from its PyTorch weights the first time it is needed
+    (and dynamically quantized to int8 when `quantize` is set); later loads,
+    including those of other worker processes, reuse the files on disk.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        quantize: bool = False,
+        export_dir: Optional[str] = None,
+        intra_op_threads: int = 0,
+    ):
+        super().__init__(model_name)
+        self.quantize = quantize
+        self.backend = "onnx-int8" if quantize else "onnx"
+        self.export_dir = export_dir or DEFAULT_EXPORT_DIR
+        self.intra_op_threads = intra_op_threads
+        self.input_names = []
+
+    @property
+    def model_path(self) -> str:
+        file_name = "model.int8.onnx" if self.quantize else "model.onnx"
+        return os.path.join(self.export_dir, self.model_name.replace("/", "__"), file_name)
+
+    def _export(self, path: str):
+        logger.info(f"Exporting {self.model_name} to ONNX: {path}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        model = AutoModel.from_pretrained(self.model_name)
+        model.eval()
+
+        sample = self.tokenizer(["export sample"], return_tensors="pt")
+        input_names = [
+            name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample
+        ]
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+        dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+        # Export next to the target and rename, so concurrent workers never read a partial file.
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with torch.no_grad():
+            torch.onnx.export(
+                model,
+                tuple(sample[name] for name in input_names),
+                tmp_path,
+                input_names=input_names,
+                output_names=["last_hidden_state"],
+                dynamic_axes=dynamic_axes,
+                opset_version=ONNX_OPSET,
+            )
+        os.replace(tmp_path, path)
+
+    def _quantize(self, source: str, path: str):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        logger.info(f"Quantizing {source} to int8: {path}")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        quantize_dynamic(source, tmp_path, weight_type=QuantType.QInt8)
+        os.replace(tmp_path, path)
+
+    def _ensure_exported(self) -> str:
+        fp32_path = os.path.join(os.path.dirname(self.model_path), "model.onnx")
+        if not os.path.exists(fp32_path):
+            self._export(fp32_path)
+        if self.quantize and not os.path.exists(self.model_path):
+            self._quantize(fp32_path, self.model_path)
+        return self.model_path
+
+    def _load_model(self):
+        path = self._ensure_exported()
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.intra_op_threads:
+            options.intra_op_num_threads = self.intra_op_threads
+
+        session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [model_input.name for model_input in session.get_inputs()]
+        return session
+
+    def _forward(self, texts: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        inputs = self.tokenizer(
+            texts,
+            return_tensors="np",
+            padding=True,
+            truncation=True,
+            max_length=self.max_length,
+        )
+        feed = {name: inputs[name].astype(np.int64) for name in self.input_names}
+        (last_hidden_state,) = self.model.run(["last_hidden_state"], feed)
+        return last_hidden_state, inputs["attention_mask"]
@@ -0,0 +1,70 @@
+import logging
+import multiprocessing
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import List
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+# Engine owned by the worker process this module is running in.
+_worker_engine = None
+
+
+def _init_worker(model_name: str, backend: str, options: dict, num_threads: int):
+    global _worker_engine
+    import torch
+
+    from .engine import get_embedding_engine
+
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    _worker_engine = get_embedding_engine(model_name, backend, **options).load()
+    logger.info(f"Embedding worker {os.getpid()} ready: {_worker_engine.identifier}")
+
+
+def _embed(texts: List[str]) -> np.ndarray:
+    return _worker_engine.embed(texts)
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+class EmbeddingWorkerPool:
+    """
+    Runs embedding forward passes in dedicated worker processes.
+
+    Every worker loads its own copy of the engine once, pins torch to
+    `num_threads` intra-op threads and then serves batches from the pool's
+    call queue, so embedding CPU is sized independently of web concurrency.
+    Workers are started with `spawn` because forking a process that already
+    initialised torch thread pools is unsafe.
+    """
+
+    def __init__(self, model_name: str, backend: str = "torch", workers: int = 1, num_threads: int = 1, **options):
+        self.model_name = model_name
+        self.backend = backend
+        self.workers = workers
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(model_name, backend, options, num_threads),
+        )
+
+    def submit(self, texts: List[str]) -> Future:
+        return self._executor.submit(_embed, list(texts))
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        return self.submit(texts).result()
+
+    def warm_up(self) -> List[int]:
+        """Starts every worker (loading its model) and returns their pids."""
+        futures = [self._executor.submit(_ping) for _ in range(self.workers)]
+        return [future.result() for future in futures]
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,61 @@
+import threading
+
+from django.conf import settings
+
+from .batching import BatchingEmbedder
+from .cache import CachedEmbedder, EmbeddingCache
+from .client import get_embedding_client
+
+
+_query_embedder = None
+_query_embedder_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Returns the process wide embedding client for MODEL_NAME on the configured
+    EMBEDDING_BACKEND, inline or backed by EMBEDDING_WORKERS worker processes.
+    """
+    return get_embedding_client(
+        settings.MODEL_NAME,
+        settings.EMBEDDING_BACKEND,
+        workers=settings.EMBEDDING_WORKERS,
+        num_threads=settings.EMBEDDING_TORCH_THREADS,
+        export_dir=settings.EMBEDDING_ONNX_DIR,
+    )
+
+
+def warm_up():
+    client = get_client()
+    client.warm_up()
+    return client
+
+
+def get_query_embedder():
+    """
+    Returns the process wide embedder used for user queries, configured from
+    Django settings: an optional embedding cache in front of the batcher.
+    """
+    global _query_embedder
+    if _query_embedder is None:
+        with _query_embedder_lock:
+            if _query_embedder is None:
+                client = get_client()
+                embedder = BatchingEmbedder(
+                    client,
+                    window_ms=settings.EMBEDDING_BATCH_WINDOW_MS,
+                    max_batch_size=settings.EMBEDDING_MAX_BATCH_SIZE,
+                )
+                if settings.EMBEDDING_CACHE_BACKEND:
+                    embedder = CachedEmbedder(
+                        embedder,
+                        EmbeddingCache(
+                            client.identifier,
+                            max_size=settings.EMBEDDING_CACHE_SIZE,
+                            ttl=settings.EMBEDDING_CACHE_TTL,
+                            backend=settings.EMBEDDING_CACHE_BACKEND,
+                            cache_alias=settings.EMBEDDING_CACHE_ALIAS,
+                        ),
+                    )
+                _query_embedder = embedder
+    return _query_embedder
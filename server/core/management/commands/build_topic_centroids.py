@@ -0,0 +1,46 @@
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.embedding.service import get_client
+from core.retrieval.service import get_chunks
+from core.retrieval.topic_gate import compute_topic_centroids, save_topic_centroids
+from core.retrieval.vector_store import normalize
+
+from .embedding_benchmark import SAMPLE_QUERIES
+
+
+class Command(BaseCommand):
+    help = (
+        "Builds the per-module topic centroids used by the out-of-context gate and reports "
+        "how sample queries score against them"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", default=settings.TOPIC_CENTROIDS_PATH)
+        parser.add_argument(
+            "--queries",
+            nargs="*",
+            default=SAMPLE_QUERIES,
+            help="Queries to score against the centroids, e.g. on and off topic examples for calibration",
+        )
+
+    def handle(self, *args, **options):
+        chunks = get_chunks()
+        topics = [meta["module"] for meta in chunks.metadata]
+        if not any(topics):
+            raise CommandError("No chunk has a module, re-index the notebooks to record chunk sources")
+
+        self.stdout.write(f"Embedding {len(chunks)} chunks...")
+        client = get_client()
+        labels, centroids = compute_topic_centroids(client.embed_in_batches(list(chunks)), topics)
+        save_topic_centroids(options["output"], labels, centroids, chunks.version)
+        self.stdout.write(f"Saved {len(labels)} topic centroids to {options['output']}")
+
+        if options["queries"]:
+            similarities = normalize(client.embed(options["queries"])) @ centroids.T
+            threshold = settings.OUT_OF_CONTEXT_GATE_CENTROID_THRESHOLD
+            for query, row in zip(options["queries"], similarities):
+                best = int(np.argmax(row))
+                verdict = "in context" if row[best] >= threshold else "out of context"
+                self.stdout.write(f"{row[best]:.3f} {labels[best]:>10} {verdict:>15}  {query}")
@@ -0,0 +1,73 @@
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.embedding.engine import EMBEDDING_BACKENDS, get_embedding_engine
+
+
+SAMPLE_QUERIES = [
+    "What is entanglement?",
+    "What is a qubit?",
+    "How does the BB84 protocol detect an eavesdropper?",
+    "Explain superposition in simple terms.",
+    "Why can't we clone an unknown quantum state?",
+    "What does a Hadamard gate do to the zero state?",
+    "How is Shor's algorithm a threat to RSA?",
+    "What is the difference between a classical bit and a qubit?",
+]
+
+
+def _cosine(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return (a * b).sum(axis=1)
+
+
+class Command(BaseCommand):
+    help = "Checks embedding backends for cosine parity against torch and measures their throughput"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--backends", nargs="+", default=list(EMBEDDING_BACKENDS), choices=EMBEDDING_BACKENDS)
+        parser.add_argument("--batch-size", default=16, type=int)
+        parser.add_argument("--rounds", default=20, type=int)
+        parser.add_argument(
+            "--min-cosine",
+            default=0.99,
+            type=float,
+            help="Fail when any sample drops below this similarity to the torch vector",
+        )
+
+    def _throughput(self, engine, texts, rounds):
+        engine.embed(texts)
+        started = time.perf_counter()
+        for _ in range(rounds):
+            engine.embed(texts)
+        elapsed = time.perf_counter() - started
+        return len(texts) * rounds / elapsed
+
+    def handle(self, *args, **options):
+        texts = (SAMPLE_QUERIES * (options["batch_size"] // len(SAMPLE_QUERIES) + 1))[: options["batch_size"]]
+        engines = {
+            backend: get_embedding_engine(settings.MODEL_NAME, backend, export_dir=settings.EMBEDDING_ONNX_DIR)
+            for backend in set(options["backends"]) | {"torch"}
+        }
+        reference = engines["torch"].embed(SAMPLE_QUERIES)
+
+        failed = []
+        for backend in options["backends"]:
+            engine = engines[backend]
+            similarity = _cosine(reference, engine.embed(SAMPLE_QUERIES))
+            single = _cosine(engine.embed(SAMPLE_QUERIES[:1]), engine.embed(SAMPLE_QUERIES)[:1])
+            rate = self._throughput(engine, texts, options["rounds"])
+
+            self.stdout.write(
+                f"{backend:>10}: cosine vs torch min={similarity.min():.5f} mean={similarity.mean():.5f}, "
+                f"single vs batch={single[0]:.5f}, throughput={rate:.1f} texts/s"
+            )
+            if similarity.min() < options["min_cosine"]:
+                failed.append(backend)
+
+        if failed:
+            raise CommandError(f"Backends below cosine parity {options['min_cosine']}: {', '.join(failed)}")
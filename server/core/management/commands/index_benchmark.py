@@ -0,0 +1,77 @@
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.embedding.service import get_client
+from core.retrieval.service import get_chunks
+from core.retrieval.vector_store import FaissHNSWVectorStore, NumpyVectorStore
+
+
+class Command(BaseCommand):
+    help = "Reports HNSW recall@k against exact search and p50/p99 query latency for several efSearch values"
+
+    def add_arguments(self, parser):
+        options = settings.VECTOR_STORE["OPTIONS"]
+        parser.add_argument("--k", default=settings.TOP_K, type=int)
+        parser.add_argument("--m", default=options.get("m", 32), type=int)
+        parser.add_argument("--ef-construction", default=options.get("ef_construction", 40), type=int)
+        parser.add_argument("--ef-search", nargs="+", default=[8, 16, 32, 64, 128, 256], type=int)
+        parser.add_argument("--queries", default=200, type=int, help="Chunks held out of the index and used as queries")
+        parser.add_argument("--seed", default=0, type=int)
+
+    def handle(self, *args, **options):
+        chunks = get_chunks()
+        if len(chunks) <= options["queries"]:
+            raise CommandError(f"Need more than {options['queries']} chunks, the store has {len(chunks)}")
+
+        self.stdout.write(f"Embedding {len(chunks)} chunks...")
+        vectors = get_client().embed_in_batches(list(chunks))
+
+        rng = np.random.default_rng(options["seed"])
+        order = rng.permutation(len(chunks))
+        query_ids, corpus_ids = order[: options["queries"]], np.sort(order[options["queries"]:])
+        queries = vectors[query_ids]
+
+        exact = NumpyVectorStore(settings.EMBEDDING_DIMENSION)
+        exact.add(corpus_ids, vectors[corpus_ids])
+        truth = [{i for i, _ in result} for result in exact.batch_search(queries, options["k"])]
+
+        started = time.perf_counter()
+        hnsw = FaissHNSWVectorStore(
+            settings.EMBEDDING_DIMENSION, m=options["m"], ef_construction=options["ef_construction"]
+        )
+        hnsw.add(corpus_ids, vectors[corpus_ids])
+        self.stdout.write(
+            f"Built HNSW (M={options['m']}, efConstruction={options['ef_construction']}) "
+            f"over {len(corpus_ids)} vectors in {time.perf_counter() - started:.2f}s"
+        )
+
+        exact_latency = self._latencies(exact, queries, options["k"])
+        self.stdout.write(
+            f"{'exact':>10}  recall@{options['k']}=1.0000  "
+            f"p50={np.percentile(exact_latency, 50):.3f}ms  p99={np.percentile(exact_latency, 99):.3f}ms"
+        )
+
+        for ef_search in options["ef_search"]:
+            # FAISS needs efSearch >= k to return k results, report the value actually used
+            ef_search = max(ef_search, options["k"])
+            hnsw.set_ef_search(ef_search)
+            results = hnsw.batch_search(queries, options["k"])
+            recall = np.mean(
+                [len(expected & {i for i, _ in result}) / len(expected) for expected, result in zip(truth, results)]
+            )
+            latency = self._latencies(hnsw, queries, options["k"])
+            self.stdout.write(
+                f"ef={ef_search:>7}  recall@{options['k']}={recall:.4f}  "
+                f"p50={np.percentile(latency, 50):.3f}ms  p99={np.percentile(latency, 99):.3f}ms"
+            )
+
+    def _latencies(self, store, queries, k):
+        latencies = []
+        for query in queries:
+            started = time.perf_counter()
+            store.search(query, k)
+            latencies.append((time.perf_counter() - started) * 1000)
+        return latencies
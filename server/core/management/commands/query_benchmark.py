@@ -0,0 +1,69 @@
+import time
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core.assistant.assistant import QuantumAssistantConversation
+from core.base.llm import FAKE_RESPONSES, FakeLLMBackend
+from core.models import Conversation
+
+from .embedding_benchmark import SAMPLE_QUERIES
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs process_query end to end (embedding, search, prompt, parsing, persistence) against the "
+        "fake LLM backend and reports latency percentiles"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("username", help="Owner of the benchmark conversations")
+        parser.add_argument("--runs", default=50, type=int)
+        parser.add_argument(
+            "--script",
+            nargs="+",
+            default=["answer"],
+            help=f"Fake responses in turn, each one of {', '.join(FAKE_RESPONSES)} or literal tagged text",
+        )
+        parser.add_argument("--latency-ms", default=0, type=float, help="Fake time to first token")
+        parser.add_argument("--chunk-size", default=16, type=int)
+        parser.add_argument("--chunk-interval-ms", default=0, type=float)
+        parser.add_argument("--stream", action="store_true", help="Stream responses, as the websocket does")
+        parser.add_argument("--course-id", default=None, type=int)
+        parser.add_argument("--keep", action="store_true", help="Keep the conversations created by the benchmark")
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options["username"])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"User {options['username']} does not exist")
+
+        llm = FakeLLMBackend(
+            options["script"],
+            latency_ms=options["latency_ms"],
+            chunk_size=options["chunk_size"],
+            chunk_interval_ms=options["chunk_interval_ms"],
+        )
+        on_text = (lambda iteration, text: None) if options["stream"] else None
+
+        conversation_ids, latencies, iterations = [], [], []
+        for run in range(options["runs"]):
+            query = SAMPLE_QUERIES[run % len(SAMPLE_QUERIES)]
+            started = time.perf_counter()
+            conversation = QuantumAssistantConversation(user, llm=llm)
+            messages = conversation.process_query(query, course_id=options["course_id"], on_text=on_text)
+            latencies.append((time.perf_counter() - started) * 1000)
+            iterations.append(len(messages) // 2)
+            conversation_ids.append(conversation.conversation_obj.id)
+
+        # The first run loads the embedding model and opens the stores
+        steady = latencies[1:] or latencies
+        self.stdout.write(
+            f"{options['runs']} queries, {np.mean(iterations):.2f} iterations on average: "
+            f"first={latencies[0]:.1f}ms p50={np.percentile(steady, 50):.1f}ms "
+            f"p95={np.percentile(steady, 95):.1f}ms p99={np.percentile(steady, 99):.1f}ms"
+        )
+
+        if not options["keep"]:
+            Conversation.objects.filter(id__in=conversation_ids).delete()
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from core.rollups import rollup_metrics
+
+
+class Command(BaseCommand):
+    help = (
+        "Rolls the PerformanceMetric rows written since the last run up into hourly PerformanceRollup rows "
+        "and SystemPrompt.performance_metrics. Meant to run periodically (e.g. every few minutes from cron)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", default=10000, type=int)
+        parser.add_argument(
+            "--settle-seconds",
+            default=60,
+            type=int,
+            help="Leave rows younger than this for the next run, their transactions may still be open",
+        )
+
+    def handle(self, *args, **options):
+        processed = rollup_metrics(options["batch_size"], options["settle_seconds"])
+        if processed is None:
+            self.stdout.write("Another rollup is running, skipped")
+            return
+        self.stdout.write(f"Rolled up {processed} metric rows")
@@ -0,0 +1,11 @@
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+from .base.metrics import render_prometheus
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint. Only answers to the hosts listed in METRICS_ALLOWED_IPS."""
+    if request.META.get("REMOTE_ADDR") not in settings.METRICS_ALLOWED_IPS:
+        return HttpResponseForbidden()
+    return HttpResponse(render_prometheus(), content_type="text/plain; version=0.0.4")
@@ -0,0 +1,67 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0003_message_is_out_of_context_message"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PerformanceRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("hour", models.DateTimeField()),
+                ("queries", models.PositiveIntegerField(default=0)),
+                (
+                    "iterations",
+                    models.FloatField(default=0, help_text="Sum of the iterations of the queries"),
+                ),
+                (
+                    "out_of_context",
+                    models.PositiveIntegerField(default=0, help_text="Queries answered as out of context"),
+                ),
+                ("input_tokens", models.BigIntegerField(default=0)),
+                ("output_tokens", models.BigIntegerField(default=0)),
+                (
+                    "latency_sum",
+                    models.FloatField(default=0, help_text="Sum of the query latencies in seconds"),
+                ),
+                (
+                    "latency_buckets",
+                    models.JSONField(
+                        default=list,
+                        help_text="Query count per latency bucket of core.base.metrics.DEFAULT_BUCKETS, +Inf last",
+                    ),
+                ),
+                (
+                    "last_metric_id",
+                    models.BigIntegerField(
+                        default=0,
+                        help_text="Last PerformanceMetric rolled up by the run that updated this row",
+                    ),
+                ),
+                (
+                    "system_prompt",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="performance_rollups",
+                        to="core.systemprompt",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("system_prompt", "hour")},
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0004_performancerollup"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="message",
+            index=models.Index(
+                fields=["conversation", "timestamp"],
+                name="message_conversation_time_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="message",
+            index=models.Index(
+                condition=models.Q(
+                    ("is_original_user_query", True),
+                    ("is_answer", True),
+                    ("is_out_of_context_message", True),
+                    _connector="OR",
+                ),
+                fields=["conversation", "timestamp"],
+                name="message_visible_idx",
+            ),
+        ),
+    ]
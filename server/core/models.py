@@ -54,6 +54,21 @@ class Message(models.Model):
     sentiment = models.FloatField(null=True, help_text="Sentiment score of the message")
     entities = models.JSONField(null=True, blank=True, help_text="Named entities extracted from the message")
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["conversation", "timestamp"], name="message_conversation_time_idx"),
+            # Only the rows shown in a conversation, see core.serializer.VISIBLE_MESSAGES
+            models.Index(
+                fields=["conversation", "timestamp"],
+                name="message_visible_idx",
+                condition=(
+                    models.Q(is_original_user_query=True)
+                    | models.Q(is_answer=True)
+                    | models.Q(is_out_of_context_message=True)
+                ),
+            ),
+        ]
+
     def __str__(self):
         return f"{self.get_message_type_display()} message in {self.conversation.title}"
 
@@ -88,4 +103,27 @@ class PerformanceMetric(models.Model):
     timestamp = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return f"{self.metric_name} for Conversation {self.conversation.id}"
\ No newline at end of file
+        return f"{self.metric_name} for Conversation {self.conversation.id}"
+
+class PerformanceRollup(models.Model):
+    """
+    Hourly aggregate of the PerformanceMetric rows of one system prompt,
+    maintained by `manage.py rollup_metrics`.
+    """
+    system_prompt = models.ForeignKey(SystemPrompt, on_delete=models.CASCADE, related_name='performance_rollups')
+    hour = models.DateTimeField()
+    queries = models.PositiveIntegerField(default=0)
+    iterations = models.FloatField(default=0, help_text="Sum of the iterations of the queries")
+    out_of_context = models.PositiveIntegerField(default=0, help_text="Queries answered as out of context")
+    input_tokens = models.BigIntegerField(default=0)
+    output_tokens = models.BigIntegerField(default=0)
+    latency_sum = models.FloatField(default=0, help_text="Sum of the query latencies in seconds")
+    latency_buckets = models.JSONField(default=list, help_text="Query count per latency bucket of core.base.metrics.DEFAULT_BUCKETS, +Inf last")
+    last_metric_id = models.BigIntegerField(default=0, help_text="Last PerformanceMetric rolled up by the run that updated this row")
+
+    class Meta:
+        unique_together = ['system_prompt', 'hour']
+
+    def __str__(self):
+        return f"{self.system_prompt} at {self.hour:%Y-%m-%d %H}:00"
+
@@ -0,0 +1,22 @@
+from rest_framework.pagination import CursorPagination
+
+
+class ConversationCursorPagination(CursorPagination):
+    """
+    Newest conversations first. Cursors stay stable while new conversations
+    are created, the id orders conversations created in the same instant.
+    """
+
+    ordering = ("-created_at", "-id")
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+
+class MessageCursorPagination(CursorPagination):
+    """Messages in the order they were sent, served by the Message(conversation, timestamp) index."""
+
+    ordering = ("timestamp", "id")
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 200
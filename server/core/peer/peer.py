@@ -1,54 +1,41 @@
-import numpy as np
-from transformers import AutoTokenizer, AutoModel
-import torch
-import faiss
-from pinecone import Pinecone
-import json
-import os
 
 from server.core.base.config import config
-
-# Load model
-tokenizer = AutoTokenizer.from_pretrained(config["model_name"])
-model = AutoModel.from_pretrained(config["model_name"])
+from server.core.embedding.client import get_embedding_client
+from server.core.retrieval.chunk_store import get_chunk_store
+from server.core.retrieval.vector_store import load_vector_store
+
+# Shared embedding client
+embedding_client = get_embedding_client(
+    config["model_name"],
+    config["embedding_backend"],
+    workers=config["embedding_workers"],
+    num_threads=config["embedding_torch_threads"],
+    export_dir=config["embedding_onnx_dir"],
+)
 
 # Initialize database
-if config["database"] == "pinecone":
-    pc = Pinecone(api_key=config["pinecone_api_key"])
-    index = pc.Index(config["pinecone_index_name"])
-    print(f"Connected to Pinecone index: {config['pinecone_index_name']}")
-elif config["database"] == "faiss":
-    if os.path.exists(config["faiss_index_file"]):
-        index = faiss.read_index(config["faiss_index_file"])
-        print(f"Loaded FAISS index from file: {config['faiss_index_file']}")
-    else:
-        print("FAISS index file not found. Please run the indexing process first.")
-        exit()
-else:
-    raise ValueError("Invalid database choice. Use 'pinecone' or 'faiss'.")
+try:
+    index = load_vector_store(
+        config["vector_store"], config["dimension"], config["vector_store_path"], **config["vector_store_options"]
+    )
+    print(f"Loaded {config['vector_store']} vector store")
+except FileNotFoundError as e:
+    print(e)
+    exit()
 
 # Load chunks
-if os.path.exists(config["chunks_file"]):
-    with open(config["chunks_file"], "r") as f:
-        chunks = json.load(f)
-    print(f"Loaded {len(chunks)} chunks from file.")
-else:
-    print("Chunks file not found. Please run the indexing process first.")
+try:
+    chunks = get_chunk_store(config["chunk_store_path"])
+    print(f"Loaded {len(chunks)} chunks from store.")
+except FileNotFoundError as e:
+    print(e)
     exit()
 
 def create_embedding(text):
-    inputs = tokenizer(text, return_tensors="pt", padding=True, truncation=True, max_length=512)
-    with torch.no_grad():
-        outputs = model(**inputs)
-    return outputs.last_hidden_state.mean(dim=1).squeeze().numpy()
+    return embedding_client.create_embedding(text)
 
 def search_similar_chunks(query_embedding, top_k=5):
-    if config["database"] == "pinecone":
-        results = index.query(vector=query_embedding.tolist(), top_k=top_k, include_metadata=True)
-        return [(match['metadata']['text'], float(match['score'])) for match in results['matches']]
-    elif config["database"] == "faiss":
-        distances, indices = index.search(np.array([query_embedding]), top_k)
-        return [(chunks[int(i)], float(d)) for i, d in zip(indices[0], distances[0])]
+    return [(chunks[chunk_id], score) for chunk_id, score in index.search(query_embedding, top_k)]
 
 def process_user_query(query):
     query_embedding = create_embedding(query)
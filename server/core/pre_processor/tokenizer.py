@@ -1,96 +1,90 @@
-import numpy as np
-from transformers import AutoTokenizer, AutoModel
-import torch
-from pinecone import Pinecone
-import faiss
-import json
 import os
 import nbformat
 import re
 
 from server.core.base.config import config
+from server.core.embedding.client import get_embedding_client
+from server.core.retrieval.chunk_store import ChunkStore, chunk_metadata, write_chunk_store
+from server.core.retrieval.vector_store import create_vector_store, load_vector_store
 from server.core.pre_processor.common import get_nb_files_path
 
-# Load model
-tokenizer = AutoTokenizer.from_pretrained(config["model_name"])
-model = AutoModel.from_pretrained(config["model_name"])
+# Shared embedding client
+embedding_client = get_embedding_client(
+    config["model_name"],
+    config["embedding_backend"],
+    workers=config["embedding_workers"],
+    num_threads=config["embedding_torch_threads"],
+    export_dir=config["embedding_onnx_dir"],
+)
 
 # Initialize database
-if config["database"] == "pinecone":
-    pc = Pinecone(api_key=config["pinecone_api_key"])
-    if config["pinecone_index_name"] not in pc.list_indexes().names():
-        pc.create_index(
-            name=config["pinecone_index_name"],
-            dimension=config["dimension"],
-            metric='cosine'
-        )
-    index = pc.Index(config["pinecone_index_name"])
-elif config["database"] == "faiss":
-    if os.path.exists(config["faiss_index_file"]):
-        index = faiss.read_index(config["faiss_index_file"])
-    else:
-        index = faiss.IndexFlatL2(config["dimension"])
-else:
-    raise ValueError("Invalid database choice. Use 'pinecone' or 'faiss'.")
+try:
+    index = load_vector_store(
+        config["vector_store"], config["dimension"], config["vector_store_path"], **config["vector_store_options"]
+    )
+except FileNotFoundError:
+    index = create_vector_store(
+        config["vector_store"],
+        config["dimension"],
+        config["vector_store_path"],
+        **config["vector_store_options"],
+        **({"create": True} if config["vector_store"] == "pinecone" else {}),
+    )
 
 # Load or initialize chunks
-if os.path.exists(config["chunks_file"]):
-    with open(config["chunks_file"], "r") as f:
-        chunks = json.load(f)
-else:
-    chunks = []
+try:
+    chunk_store = ChunkStore(config["chunk_store_path"])
+    chunks, chunks_metadata = list(chunk_store), list(chunk_store.metadata)
+except FileNotFoundError:
+    # Chunks indexed before the chunk store existed (config["chunks_file"]) have no source and
+    # no matching vector index, so the notebooks are indexed again from scratch.
+    chunks, chunks_metadata = [], []
 
 
 def create_embedding(text):
-    inputs = tokenizer(text, return_tensors="pt", padding=True, truncation=True, max_length=512)
-    with torch.no_grad():
-        outputs = model(**inputs)
-    return outputs.last_hidden_state.mean(dim=1).squeeze().numpy()
+    return embedding_client.create_embedding(text)
 
 
-def index_chunks(new_chunks):
+def index_chunks(new_chunks, new_metadata):
     global chunks
     if not new_chunks:
         print("No new chunks to index.")
         return
 
     chunks.extend(new_chunks)
-    embeddings = [create_embedding(chunk) for chunk in new_chunks]
+    chunks_metadata.extend(new_metadata)
+    embeddings = embedding_client.embed_in_batches(new_chunks)
 
-    if config["database"] == "pinecone":
-        to_upsert = [(str(i + len(chunks) - len(new_chunks)), emb.tolist(), {"text": chunk})
-                     for i, (emb, chunk) in enumerate(zip(embeddings, new_chunks))]
-        index.upsert(vectors=to_upsert)
-    elif config["database"] == "faiss":
-        index.add(np.array(embeddings))
+    first_id = len(chunks) - len(new_chunks)
+    index.add(list(range(first_id, len(chunks))), embeddings, new_metadata)
 
     # Save chunks
-    with open(config["chunks_file"], "w") as f:
-        json.dump(chunks, f)
+    write_chunk_store(config["chunk_store_path"], chunks, chunks_metadata)
 
-    # Save Faiss index if using Faiss
-    if config["database"] == "faiss":
-        faiss.write_index(index, config["faiss_index_file"])
+    # Persist the local index (no-op for Pinecone)
+    index.save()
 
 
-def extract_text_from_notebook(notebook_path):
+def extract_cells_from_notebook(notebook_path):
+    """Returns (cell_ID, text) for every markdown cell. cell_ID is None for cells without cell_details."""
     try:
         with open(notebook_path, 'r', encoding='utf-8') as f:
             nb = nbformat.read(f, as_version=4)
 
-        text = ""
+        cells = []
         for cell in nb.cells:
+            cell_id = cell.metadata.get('cell_details', {}).get('cell_ID')
             if cell.cell_type == 'markdown':
-                text += cell.source + "\n\n"
+                cells.append((cell_id, cell.source))
             elif cell.cell_type == 'code':
                 # Uncomment the next line if you want to include code cells
-                # text += cell.source + "\n\n"
+                # cells.append((cell_id, cell.source))
                 pass
 
-        return text
+        return cells
     except Exception as e:
         print(f"Error processing notebook {notebook_path}: {str(e)}")
-        return ""
+        return []
 
 
 def clean_text(text):
@@ -109,25 +103,28 @@ def chunk_text(text, chunk_size=3):
 def process_notebooks(directory):
     notebook_files = get_nb_files_path(directory)
     all_chunks = []
+    all_metadata = []
     for notebook_file in notebook_files:
         print(f"Processing notebook: {notebook_file}")
-        text = extract_text_from_notebook(notebook_file)
-        if text:
+        notebook = os.path.splitext(os.path.basename(notebook_file))[0]
+        # Chunk cell by cell so every chunk can be traced back to its cell and module
+        for cell_id, text in extract_cells_from_notebook(notebook_file):
             clean_text_content = clean_text(text)
             chunks = chunk_text(clean_text_content, config["chunk_size"])
             all_chunks.extend(chunks)
+            all_metadata.extend(chunk_metadata(cell_id, notebook) for _ in chunks)
 
     print(f"Total chunks extracted: {len(all_chunks)}")
-    return all_chunks
+    return all_chunks, all_metadata
 
 
 def main():
     # Main processing
     if not chunks:
         print("Processing notebooks...")
-        new_chunks = process_notebooks(config["notebook_directory"])
+        new_chunks, new_metadata = process_notebooks(config["notebook_directory"])
         if new_chunks:
-            index_chunks(new_chunks)
+            index_chunks(new_chunks, new_metadata)
             print("Notebook processing and indexing complete.")
         else:
             print("No valid chunks found in notebooks. Please check your notebook content and directory path.")
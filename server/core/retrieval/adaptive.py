@@ -0,0 +1,22 @@
+from .vector_store import SearchResult
+
+
+def similarity_cutoff(results: SearchResult, min_similarity: float, score_gap: float) -> SearchResult:
+    """
+    Keeps the leading results (sorted best first) that are at least
+    `min_similarity` and within `score_gap` (relative) of the best score.
+
+    A confident match therefore yields a short context, a weak one a longer
+    context, and a query that matches nothing yields no results at all.
+    """
+    if not results:
+        return []
+
+    threshold = max(min_similarity, results[0][1] * (1 - score_gap))
+
+    kept = []
+    for chunk_id, score in results:
+        if score < threshold:
+            break
+        kept.append((chunk_id, score))
+    return kept
@@ -0,0 +1,208 @@
+import glob
+import hashlib
+import json
+import mmap
+import os
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+
+DATA_FILES = ("blob", "offsets", "metadata")
+
+
+def _paths(path: str, version: Optional[str] = None) -> Dict[str, str]:
+    """
+    File names of the store at `path`. Data files of a given `version` carry
+    it in their name, unversioned names are those of stores written before
+    stores were versioned.
+    """
+    prefix = f"{path}.{version}" if version else path
+    return {
+        "offsets": f"{prefix}.offsets.npy",
+        "blob": f"{prefix}.blob",
+        "metadata": f"{prefix}.metadata.json",
+        "manifest": f"{path}.manifest.json",
+    }
+
+
+def _read_manifest(path: str) -> Optional[dict]:
+    try:
+        with open(_paths(path)["manifest"]) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _remove_versions(path: str, keep: Iterable[str]):
+    """Deletes the data files of every version of the store at `path` not in `keep`."""
+    keep = {_paths(path, version)[name] for version in keep for name in DATA_FILES}
+    for name in DATA_FILES:
+        suffix = _paths("", "*")[name]
+        for file in glob.glob(glob.escape(path) + suffix):
+            if file not in keep:
+                os.remove(file)
+
+
+def chunk_metadata(cell_id: Optional[str], notebook: Optional[str] = None) -> dict:
+    """Source of a chunk. Modules are the cell ID prefix, e.g. "mod18" for "mod18-lo3"."""
+    return {
+        "cell_id": cell_id,
+        "module": cell_id.split("-")[0] if cell_id else None,
+        "notebook": notebook,
+    }
+
+
+def write_chunk_store(path: str, chunks: Iterable[str], metadata: Optional[Sequence[dict]] = None) -> str:
+    """
+    Writes `chunks` as one UTF-8 blob plus an offsets array, and their
+    `metadata` (see `chunk_metadata`) alongside, and returns the store version
+    (a digest of the content).
+
+    Data files are named after the version and the manifest, which names the
+    current version, is replaced last: that rename is the single point where
+    readers switch to the new store, so a store opened at any time is
+    consistent. The previous version is kept for processes opening it
+    concurrently, older ones are deleted.
+    """
+    paths = _paths(path, "tmp")
+    tmp_suffix = f".{os.getpid()}.tmp"
+    digest = hashlib.sha1()
+    offsets = [0]
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    with open(paths["blob"] + tmp_suffix, "wb") as blob:
+        for chunk in chunks:
+            data = chunk.encode("utf-8")
+            blob.write(data)
+            digest.update(len(data).to_bytes(8, "little"))
+            digest.update(data)
+            offsets.append(offsets[-1] + len(data))
+
+    with open(paths["offsets"] + tmp_suffix, "wb") as f:
+        np.save(f, np.asarray(offsets, dtype=np.uint64))
+
+    metadata = list(metadata) if metadata is not None else [chunk_metadata(None)] * (len(offsets) - 1)
+    if len(metadata) != len(offsets) - 1:
+        raise ValueError(f"Got metadata for {len(metadata)} chunks, expected {len(offsets) - 1}")
+    encoded_metadata = json.dumps(metadata)
+    digest.update(encoded_metadata.encode("utf-8"))
+    with open(paths["metadata"] + tmp_suffix, "w") as f:
+        f.write(encoded_metadata)
+
+    version = digest.hexdigest()[:16]
+    versioned = _paths(path, version)
+    for name in DATA_FILES:
+        os.replace(paths[name] + tmp_suffix, versioned[name])
+
+    previous = _read_manifest(path)
+    with open(paths["manifest"] + tmp_suffix, "w") as f:
+        json.dump({"count": len(offsets) - 1, "version": version, "versioned_files": True}, f)
+    os.replace(paths["manifest"] + tmp_suffix, paths["manifest"])
+
+    keep = {version}
+    if previous and previous.get("versioned_files"):
+        keep.add(previous["version"])
+    _remove_versions(path, keep)
+    return version
+
+
+class ChunkStore:
+    """
+    Read-only, memory-mapped view of the chunks written by `write_chunk_store`.
+
+    Lookups by chunk id are O(1) and decode only the requested chunk. Pages
+    come from the OS page cache, so every conversation and every worker
+    process on the host shares a single copy of the text. Chunk metadata is
+    small and kept in memory together with per-cell and per-module
+    partitions of the chunk ids.
+    """
+
+    # Times the manifest is re-read when its files were removed by newer writes
+    OPEN_ATTEMPTS = 3
+
+    def __init__(self, path: str):
+        self.path = path
+        for attempt in range(self.OPEN_ATTEMPTS):
+            manifest = _read_manifest(path)
+            if manifest is None:
+                raise FileNotFoundError(
+                    f"Chunk store {path} not found. Please run the indexing process first."
+                )
+            try:
+                self._open(manifest)
+                return
+            except FileNotFoundError:
+                if attempt == self.OPEN_ATTEMPTS - 1:
+                    raise
+
+    def _open(self, manifest: dict):
+        self.version = manifest["version"]
+        paths = _paths(self.path, self.version if manifest.get("versioned_files") else None)
+        self.offsets = np.load(paths["offsets"], mmap_mode="r")
+
+        with open(paths["blob"], "rb") as blob:
+            if os.fstat(blob.fileno()).st_size:
+                self._blob = mmap.mmap(blob.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self._blob = b""
+
+        if os.path.exists(paths["metadata"]):
+            with open(paths["metadata"]) as f:
+                self.metadata = json.load(f)
+        else:
+            self.metadata = [chunk_metadata(None)] * len(self)
+
+        self._cell_partitions = defaultdict(list)
+        self._module_partitions = defaultdict(list)
+        for chunk_id, meta in enumerate(self.metadata):
+            if meta["cell_id"]:
+                self._cell_partitions[meta["cell_id"]].append(chunk_id)
+                self._module_partitions[meta["module"]].append(chunk_id)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, chunk_id: int) -> str:
+        if not 0 <= chunk_id < len(self):
+            raise IndexError(f"Chunk {chunk_id} is not in the store")
+        start, end = int(self.offsets[chunk_id]), int(self.offsets[chunk_id + 1])
+        return self._blob[start:end].decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        for chunk_id in range(len(self)):
+            yield self[chunk_id]
+
+    def get_many(self, chunk_ids: Sequence[int]) -> List[str]:
+        return [self[chunk_id] for chunk_id in chunk_ids]
+
+    def ids_for(
+        self, cell_ids: Optional[Iterable[str]] = None, modules: Optional[Iterable[str]] = None
+    ) -> np.ndarray:
+        """Sorted ids of the chunks that come from any of `cell_ids` or `modules`."""
+        ids = set()
+        for cell_id in cell_ids or ():
+            ids.update(self._cell_partitions.get(cell_id, ()))
+        for module in modules or ():
+            ids.update(self._module_partitions.get(module, ()))
+        return np.fromiter(sorted(ids), dtype=np.int64, count=len(ids))
+
+
+_STORES: Dict[str, ChunkStore] = {}
+_STORES_LOCK = threading.Lock()
+
+
+def get_chunk_store(path: str) -> ChunkStore:
+    """Returns the process wide store for `path`, opening it on first call."""
+    store = _STORES.get(path)
+    if store is None:
+        with _STORES_LOCK:
+            store = _STORES.get(path)
+            if store is None:
+                store = _STORES[path] = ChunkStore(path)
+    return store
@@ -0,0 +1,94 @@
+import math
+import re
+from dataclasses import dataclass, field
+from typing import List, Set, Tuple
+
+from .chunk_store import ChunkStore
+from .vector_store import SearchResult
+
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def count_tokens(text: str) -> int:
+    """
+    Local estimate of the LLM token count: one token per punctuation mark and
+    one per started group of 4 word characters, which stays close to (and
+    slightly above) Claude's tokenizer on English course text.
+    """
+    return sum(math.ceil(len(piece) / 4) for piece in _TOKEN_PATTERN.findall(text))
+
+
+@dataclass
+class PackedContext:
+    # (text, score) per context block, adjacent chunks of one cell merged into one block
+    blocks: List[Tuple[str, float]] = field(default_factory=list)
+    # (chunk id, score) of every chunk included
+    chunks: SearchResult = field(default_factory=list)
+    tokens: int = 0
+
+
+def format_context(blocks: List[Tuple[str, float]]) -> str:
+    """The context text of the prompt, one list item per block."""
+    return "\n".join(f"- {text}" for text, _ in blocks)
+
+
+def merge_blocks(chunk_store: ChunkStore, chunks: SearchResult) -> List[Tuple[str, float]]:
+    """
+    Context blocks of `chunks`: runs of consecutive chunk ids from the same
+    cell are merged into one block, scored by their best chunk, and blocks
+    are sorted by score.
+    """
+    def same_source(chunk_id: int, other_id: int) -> bool:
+        meta, other = chunk_store.metadata[chunk_id], chunk_store.metadata[other_id]
+        return meta["cell_id"] == other["cell_id"] and meta["notebook"] == other["notebook"]
+
+    scores = dict(chunks)
+    blocks = []
+    for chunk_id in sorted(scores):
+        previous = blocks[-1] if blocks else None
+        if previous and previous[-1] == chunk_id - 1 and same_source(previous[-1], chunk_id):
+            previous.append(chunk_id)
+        else:
+            blocks.append([chunk_id])
+
+    return sorted(
+        (
+            (" ".join(chunk_store.get_many(block)), max(scores[chunk_id] for chunk_id in block))
+            for block in blocks
+        ),
+        key=lambda block: -block[1],
+    )
+
+
+class ContextPacker:
+    """
+    Builds the context of one LLM call from ranked chunks.
+
+    Chunks already sent earlier in the conversation (`sent`) are skipped, the
+    rest are taken in score order while they fit in `token_budget`, and
+    chunks that were consecutive windows of the same cell are merged back
+    into one block. Packed chunk ids are added to `sent`.
+    """
+
+    def __init__(self, chunk_store: ChunkStore, token_budget: int, sent: Set[int]):
+        self.chunk_store = chunk_store
+        self.token_budget = token_budget
+        self.sent = sent
+
+    def pack(self, results: SearchResult) -> PackedContext:
+        packed = PackedContext()
+        packed_ids = set()
+        for chunk_id, score in sorted(results, key=lambda result: -result[1]):
+            if chunk_id in self.sent or chunk_id in packed_ids:
+                continue
+            tokens = count_tokens(self.chunk_store[chunk_id]) + 2  # "- " list marker and newline
+            if packed.tokens + tokens > self.token_budget:
+                continue
+            packed_ids.add(chunk_id)
+            packed.chunks.append((chunk_id, score))
+            packed.tokens += tokens
+
+        packed.blocks = merge_blocks(self.chunk_store, packed.chunks)
+        self.sent.update(packed_ids)
+        return packed
@@ -0,0 +1,39 @@
+import re
+from collections import defaultdict
+from typing import List, Sequence
+
+from .vector_store import SearchResult
+
+
+_LIST_MARKER = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s*")
+
+
+def split_questions(text: str) -> List[str]:
+    """
+    Individual questions of a list such as the `insufficient_data` follow
+    ups ("- Question one?\n- Question two?"), without their list markers.
+    When some lines are list items, other lines (an introduction) are left out.
+    """
+    lines = [line for line in text.splitlines() if line.strip()]
+    items = [line for line in lines if _LIST_MARKER.match(line)]
+
+    questions = []
+    for line in items or lines:
+        question = _LIST_MARKER.sub("", line).strip()
+        if question and question not in questions:
+            questions.append(question)
+    return questions
+
+
+def reciprocal_rank_fusion(rankings: Sequence[SearchResult], k: int = 60) -> SearchResult:
+    """
+    Fuses several rankings into one, scoring each chunk by the sum of
+    1 / (k + rank) over the rankings it appears in (rank starting at 1).
+    Chunks found by several queries rise above chunks only one query ranks
+    first; `k` damps the weight of the very top ranks.
+    """
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, (chunk_id, _) in enumerate(ranking, start=1):
+            scores[chunk_id] += 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda result: (-result[1], result[0]))
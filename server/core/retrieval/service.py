@@ -0,0 +1,52 @@
+import threading
+
+from django.conf import settings
+
+from .chunk_store import ChunkStore, get_chunk_store
+from .topic_gate import OutOfContextGate, load_topic_centroids
+from .vector_store import VectorStore, load_vector_store
+
+
+_vector_store = None
+_vector_store_lock = threading.Lock()
+_out_of_context_gates = {}
+
+
+def get_vector_store() -> VectorStore:
+    """Returns the process wide vector store configured by settings.VECTOR_STORE, loading it on first call."""
+    global _vector_store
+    if _vector_store is None:
+        with _vector_store_lock:
+            if _vector_store is None:
+                _vector_store = load_vector_store(
+                    settings.VECTOR_STORE["BACKEND"],
+                    settings.EMBEDDING_DIMENSION,
+                    settings.VECTOR_STORE["PATH"],
+                    **settings.VECTOR_STORE["OPTIONS"],
+                )
+    return _vector_store
+
+
+def get_chunks() -> ChunkStore:
+    """Returns the memory-mapped chunk store at settings.CHUNK_STORE_PATH."""
+    return get_chunk_store(settings.CHUNK_STORE_PATH)
+
+
+def get_out_of_context_gate() -> OutOfContextGate:
+    """
+    Returns the out-of-context gate configured by the OUT_OF_CONTEXT_GATE_*
+    settings, with the topic centroids of the current chunk store (see
+    `manage.py build_topic_centroids`) when they exist.
+    """
+    chunks = get_chunks()
+    gate = _out_of_context_gates.get(chunks.version)
+    if gate is None:
+        centroids = load_topic_centroids(settings.TOPIC_CENTROIDS_PATH, chunks.version)
+        labels, centroids = centroids if centroids is not None else (None, None)
+        gate = _out_of_context_gates[chunks.version] = OutOfContextGate(
+            settings.OUT_OF_CONTEXT_GATE_RETRIEVAL_THRESHOLD,
+            settings.OUT_OF_CONTEXT_GATE_CENTROID_THRESHOLD,
+            labels,
+            centroids,
+        )
+    return gate
@@ -0,0 +1,86 @@
+from typing import Dict, List, Optional, Sequence, Set
+
+import numpy as np
+
+from .adaptive import similarity_cutoff
+from .fusion import reciprocal_rank_fusion
+from .vector_store import SearchResult, VectorStore
+
+
+class RetrievalSession:
+    """
+    Retrieval state of one user query across its follow-up iterations.
+
+    Each distinct query vector is searched once, `depth` results deep, and
+    its ranking (cut by `similarity_cutoff`) is kept; `next_page` then hands
+    out the best chunks not in `seen`, so follow-up iterations neither repeat
+    the search nor resend chunks the model has already seen. The caller adds
+    the chunks it actually sends to `seen` (see `ContextPacker`), which may be
+    shared across the queries of a conversation.
+
+    Several query vectors (e.g. the follow-up questions of an
+    `insufficient_data` response) are searched in one batch and their
+    rankings fused with `reciprocal_rank_fusion`.
+    """
+
+    def __init__(
+        self,
+        vector_store: VectorStore,
+        depth: int,
+        chunk_ids: Optional[np.ndarray] = None,
+        cell_ids: Optional[Sequence[str]] = None,
+        min_similarity: float = 0.0,
+        score_gap: float = 1.0,
+        seen: Optional[Set[int]] = None,
+        rrf_k: int = 60,
+    ):
+        self.vector_store = vector_store
+        self.depth = depth
+        self.chunk_ids = chunk_ids
+        self.cell_ids = cell_ids
+        self.min_similarity = min_similarity
+        self.score_gap = score_gap
+        self.seen: Set[int] = seen if seen is not None else set()
+        self.rrf_k = rrf_k
+        self._rankings: Dict[bytes, SearchResult] = {}
+        self._best_scores: Dict[bytes, float] = {}
+
+    def rankings(self, query_embeddings: np.ndarray) -> List[SearchResult]:
+        """Ranking per row of `query_embeddings`, searching the new ones in a single batch."""
+        query_embeddings = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        keys = [vector.tobytes() for vector in query_embeddings]
+
+        missing = {}
+        for row, key in enumerate(keys):
+            if key not in self._rankings:
+                missing.setdefault(key, row)
+        if missing:
+            results = self.vector_store.batch_search(
+                query_embeddings[list(missing.values())], self.depth, self.chunk_ids, self.cell_ids
+            )
+            for key, result in zip(missing, results):
+                self._best_scores[key] = result[0][1] if result else 0.0
+                self._rankings[key] = similarity_cutoff(result, self.min_similarity, self.score_gap)
+
+        return [self._rankings[key] for key in keys]
+
+    def ranking(self, query_embeddings: np.ndarray) -> SearchResult:
+        """Ranking of one query vector, or the fused ranking of several."""
+        rankings = self.rankings(query_embeddings)
+        if len(rankings) == 1:
+            return rankings[0]
+        return reciprocal_rank_fusion(rankings, self.rrf_k)
+
+    def best_score(self, query_embedding: np.ndarray) -> float:
+        """Similarity of the best match in scope, before the similarity cutoff."""
+        self.rankings(query_embedding)
+        return self._best_scores[np.asarray(query_embedding, dtype=np.float32).tobytes()]
+
+    def next_page(self, query_embeddings: np.ndarray, page_size: int) -> SearchResult:
+        page = []
+        for chunk_id, score in self.ranking(query_embeddings):
+            if len(page) == page_size:
+                break
+            if chunk_id not in self.seen:
+                page.append((chunk_id, score))
+        return page
@@ -0,0 +1,90 @@
+import logging
+import os
+from dataclasses import dataclass
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from .vector_store import normalize
+
+
+logger = logging.getLogger(__name__)
+
+
+def compute_topic_centroids(vectors: np.ndarray, topics: Sequence[Optional[str]]):
+    """
+    Normalized mean embedding per topic (e.g. the chunk store `module`).
+    Chunks without a topic are left out. Returns (labels, centroids).
+    """
+    vectors = normalize(vectors)
+    labels = sorted({topic for topic in topics if topic})
+    index = {label: i for i, label in enumerate(labels)}
+
+    sums = np.zeros((len(labels), vectors.shape[1]), dtype=np.float32)
+    for vector, topic in zip(vectors, topics):
+        if topic:
+            sums[index[topic]] += vector
+    return labels, normalize(sums) if labels else sums
+
+
+def save_topic_centroids(path: str, labels: List[str], centroids: np.ndarray, version: str):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, labels=np.asarray(labels), centroids=centroids, version=np.asarray(version))
+    os.replace(tmp_path, path)
+
+
+def load_topic_centroids(path: str, version: Optional[str] = None):
+    """
+    Returns (labels, centroids) saved by `save_topic_centroids`, or None when
+    the file is missing or was built for another chunk store `version`.
+    """
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        if version is not None and str(data["version"]) != version:
+            logger.warning(f"Topic centroids {path} were built for another chunk store, ignoring them")
+            return None
+        return [str(label) for label in data["labels"]], data["centroids"].astype(np.float32)
+
+
+@dataclass
+class GateDecision:
+    out_of_context: bool
+    best_score: float
+    topic: Optional[str] = None
+    topic_score: Optional[float] = None
+
+
+class OutOfContextGate:
+    """
+    Local check run before the first LLM call of a query.
+
+    A query is out of context when its best retrieval similarity stays below
+    `retrieval_threshold` and it is not close to any course topic either: no
+    topic centroid reaches `centroid_threshold`. Without centroids only the
+    retrieval similarity is used.
+    """
+
+    def __init__(
+        self,
+        retrieval_threshold: float,
+        centroid_threshold: float,
+        labels: Optional[List[str]] = None,
+        centroids: Optional[np.ndarray] = None,
+    ):
+        self.retrieval_threshold = retrieval_threshold
+        self.centroid_threshold = centroid_threshold
+        self.labels = labels or []
+        self.centroids = centroids
+
+    def check(self, query_embedding: np.ndarray, best_score: float) -> GateDecision:
+        if best_score >= self.retrieval_threshold:
+            return GateDecision(False, best_score)
+        if self.centroids is None or not len(self.labels):
+            return GateDecision(True, best_score)
+
+        similarities = self.centroids @ normalize(query_embedding)[0]
+        best = int(np.argmax(similarities))
+        topic_score = float(similarities[best])
+        return GateDecision(topic_score < self.centroid_threshold, best_score, self.labels[best], topic_score)
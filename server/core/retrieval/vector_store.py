@@ -0,0 +1,343 @@
+import logging
+import os
+from abc import ABC, abstractmethod
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+SearchResult = List[Tuple[int, float]]
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.clip(norms, 1e-12, None)
+
+
+class VectorStore(ABC):
+    """
+    Index of chunk embeddings addressed by integer chunk ids.
+
+    Every backend scores by cosine similarity (higher is more similar), so
+    scores are comparable no matter which backend is configured. Searches can
+    be pre-filtered to a set of chunk ids (e.g. the chunks of one course), or
+    to the cells (learning objects) they come from on backends that filter
+    on chunk metadata.
+    """
+
+    backend = None
+    # Whether `delete` can remove vectors, otherwise the index must be rebuilt
+    supports_delete = True
+
+    def __init__(self, dimension: int, path: Optional[str] = None):
+        self.dimension = dimension
+        self.path = path
+
+    @abstractmethod
+    def add(self, ids: Sequence[int], vectors: np.ndarray, metadata: Optional[List[dict]] = None):
+        pass
+
+    @abstractmethod
+    def batch_search(
+        self,
+        vectors: np.ndarray,
+        top_k: int,
+        ids: Optional[np.ndarray] = None,
+        cell_ids: Optional[Sequence[str]] = None,
+    ) -> List[SearchResult]:
+        """
+        Returns the `top_k` best matches per vector, only among `ids` when
+        given. `cell_ids`, when given, are the cells the chunks of `ids` come
+        from: remote backends filter on them, as a filter listing every
+        chunk id of a large scope exceeds their limits.
+        """
+        pass
+
+    def search(
+        self,
+        vector: np.ndarray,
+        top_k: int,
+        ids: Optional[np.ndarray] = None,
+        cell_ids: Optional[Sequence[str]] = None,
+    ) -> SearchResult:
+        return self.batch_search(np.atleast_2d(vector), top_k, ids, cell_ids)[0]
+
+    @abstractmethod
+    def delete(self, ids: Sequence[int]):
+        """Removes the vectors of `ids`. Raises ValueError when the backend does not `supports_delete`."""
+        pass
+
+    @abstractmethod
+    def save(self, path: Optional[str] = None):
+        pass
+
+    @classmethod
+    @abstractmethod
+    def load(cls, dimension: int, path: Optional[str] = None, **options) -> "VectorStore":
+        pass
+
+    @abstractmethod
+    def __len__(self) -> int:
+        pass
+
+
+class NumpyVectorStore(VectorStore):
+    """Exact search as one matrix product over normalized vectors. Fastest for small corpora."""
+
+    backend = "numpy"
+
+    def __init__(self, dimension: int, path: Optional[str] = None):
+        super().__init__(dimension, path)
+        self.ids = np.empty(0, dtype=np.int64)
+        self.vectors = np.empty((0, dimension), dtype=np.float32)
+
+    def add(self, ids, vectors, metadata=None):
+        self.ids = np.concatenate([self.ids, np.asarray(ids, dtype=np.int64)])
+        self.vectors = np.concatenate([self.vectors, normalize(vectors)])
+
+    def batch_search(self, vectors, top_k, ids=None, cell_ids=None):
+        store_ids, store_vectors = self.ids, self.vectors
+        if ids is not None:
+            allowed = np.isin(store_ids, ids)
+            store_ids, store_vectors = store_ids[allowed], store_vectors[allowed]
+
+        if not len(store_ids):
+            return [[] for _ in range(len(np.atleast_2d(vectors)))]
+
+        top_k = min(top_k, len(store_ids))
+        scores = normalize(vectors) @ store_vectors.T
+        results = []
+        for row in scores:
+            best = np.argpartition(-row, top_k - 1)[:top_k]
+            best = best[np.argsort(-row[best])]
+            results.append([(int(store_ids[i]), float(row[i])) for i in best])
+        return results
+
+    def delete(self, ids):
+        keep = ~np.isin(self.ids, np.asarray(ids, dtype=np.int64))
+        self.ids, self.vectors = self.ids[keep], self.vectors[keep]
+
+    def save(self, path=None):
+        path = path or self.path
+        with open(path, "wb") as f:
+            np.savez(f, ids=self.ids, vectors=self.vectors)
+
+    @classmethod
+    def load(cls, dimension, path=None, **options):
+        store = cls(dimension, path)
+        with np.load(path) as data:
+            store.ids, store.vectors = data["ids"], data["vectors"]
+        return store
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class FaissVectorStore(VectorStore):
+    """FAISS index over normalized vectors (inner product == cosine), addressed through an id map."""
+
+    def __init__(self, dimension: int, path: Optional[str] = None, index=None):
+        super().__init__(dimension, path)
+        self.index = index if index is not None else self._create_index()
+
+    @abstractmethod
+    def _create_index(self):
+        """A new, empty FAISS index wrapped in an id map."""
+        pass
+
+    def add(self, ids, vectors, metadata=None):
+        self.index.add_with_ids(normalize(vectors), np.asarray(ids, dtype=np.int64))
+
+    def _search_parameters(self, selector):
+        import faiss
+
+        return faiss.SearchParameters(sel=selector)
+
+    def batch_search(self, vectors, top_k, ids=None, cell_ids=None):
+        import faiss
+
+        params = None
+        if ids is not None:
+            if not len(ids):
+                return [[] for _ in range(len(np.atleast_2d(vectors)))]
+            params = self._search_parameters(faiss.IDSelectorBatch(np.asarray(ids, dtype=np.int64)))
+
+        scores, result_ids = self.index.search(normalize(vectors), top_k, params=params)
+        return [
+            [(int(i), float(s)) for i, s in zip(row_ids, row_scores) if i != -1]
+            for row_ids, row_scores in zip(result_ids, scores)
+        ]
+
+    def delete(self, ids):
+        self.index.remove_ids(np.asarray(ids, dtype=np.int64))
+
+    def save(self, path=None):
+        import faiss
+
+        faiss.write_index(self.index, path or self.path)
+
+    @classmethod
+    def load(cls, dimension, path=None, **options):
+        import faiss
+
+        return cls(dimension, path, index=faiss.read_index(path), **options)
+
+    def __len__(self):
+        return self.index.ntotal
+
+
+class FaissFlatVectorStore(FaissVectorStore):
+    """Exact FAISS search."""
+
+    backend = "faiss-flat"
+
+    def _create_index(self):
+        import faiss
+
+        return faiss.IndexIDMap2(faiss.IndexFlatIP(self.dimension))
+
+
+class FaissHNSWVectorStore(FaissVectorStore):
+    """
+    Approximate search on a FAISS HNSW graph.
+
+    `m` (graph degree) and `ef_construction` trade build time and memory for
+    graph quality and only apply when the index is built; `ef_search` trades
+    query latency for recall and can be changed at any time.
+    """
+
+    backend = "faiss-hnsw"
+    supports_delete = False
+
+    def __init__(
+        self,
+        dimension: int,
+        path: Optional[str] = None,
+        index=None,
+        m: int = 32,
+        ef_construction: int = 40,
+        ef_search: int = 16,
+    ):
+        self.m = m
+        self.ef_construction = ef_construction
+        super().__init__(dimension, path, index)
+        self.set_ef_search(ef_search)
+
+    def _create_index(self):
+        import faiss
+
+        hnsw = faiss.IndexHNSWFlat(self.dimension, self.m, faiss.METRIC_INNER_PRODUCT)
+        hnsw.hnsw.efConstruction = self.ef_construction
+        return faiss.IndexIDMap2(hnsw)
+
+    @property
+    def hnsw(self):
+        import faiss
+
+        return faiss.downcast_index(self.index.index).hnsw
+
+    def set_ef_search(self, ef_search: int):
+        self.ef_search = ef_search
+        self.hnsw.efSearch = ef_search
+
+    def _search_parameters(self, selector):
+        import faiss
+
+        # Parameters passed with a search replace the index defaults, efSearch included.
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=self.ef_search)
+
+    def delete(self, ids):
+        raise ValueError("HNSW indexes do not support removal, rebuild the index instead.")
+
+
+class PineconeVectorStore(VectorStore):
+    """Adapter for a remote Pinecone index created with the cosine metric."""
+
+    backend = "pinecone"
+
+    def __init__(
+        self,
+        dimension: int,
+        path: Optional[str] = None,
+        api_key: Optional[str] = None,
+        index_name: Optional[str] = None,
+        create: bool = False,
+    ):
+        from pinecone import Pinecone
+
+        super().__init__(dimension, path)
+        pc = Pinecone(api_key=api_key)
+        if create and index_name not in pc.list_indexes().names():
+            pc.create_index(name=index_name, dimension=dimension, metric="cosine")
+        self.index = pc.Index(index_name)
+        logger.info(f"Connected to Pinecone index: {index_name}")
+
+    def add(self, ids, vectors, metadata=None):
+        metadata = metadata or [{} for _ in ids]
+        to_upsert = []
+        for i, vector, meta in zip(ids, np.atleast_2d(vectors), metadata):
+            # Pinecone filters on metadata only, so the chunk id is stored there too.
+            # It also rejects null values.
+            meta = {key: value for key, value in meta.items() if value is not None}
+            to_upsert.append((str(i), vector.tolist(), dict(meta, chunk_id=int(i))))
+        self.index.upsert(vectors=to_upsert)
+
+    def batch_search(self, vectors, top_k, ids=None, cell_ids=None):
+        # The cell id is in the metadata of every chunk (see `add`), and a course has far
+        # fewer cells than chunks.
+        query_filter = None
+        if cell_ids is not None:
+            query_filter = {"cell_id": {"$in": list(cell_ids)}}
+        elif ids is not None:
+            query_filter = {"chunk_id": {"$in": [int(i) for i in ids]}}
+
+        results = []
+        for vector in np.atleast_2d(vectors):
+            response = self.index.query(vector=vector.tolist(), top_k=top_k, filter=query_filter)
+            results.append([(int(match["id"]), float(match["score"])) for match in response["matches"]])
+        return results
+
+    def delete(self, ids):
+        self.index.delete(ids=[str(i) for i in ids])
+
+    def save(self, path=None):
+        # Pinecone persists every upsert remotely.
+        pass
+
+    @classmethod
+    def load(cls, dimension, path=None, **options):
+        return cls(dimension, path, **options)
+
+    def __len__(self):
+        return self.index.describe_index_stats()["total_vector_count"]
+
+
+VECTOR_STORE_BACKENDS = {
+    store.backend: store
+    for store in (NumpyVectorStore, FaissFlatVectorStore, FaissHNSWVectorStore, PineconeVectorStore)
+}
+
+
+def _get_backend(backend: str):
+    try:
+        return VECTOR_STORE_BACKENDS[backend]
+    except KeyError:
+        raise ValueError(
+            f"Invalid vector store backend '{backend}'. Use one of {list(VECTOR_STORE_BACKENDS)}."
+        )
+
+
+def create_vector_store(backend: str, dimension: int, path: Optional[str] = None, **options) -> VectorStore:
+    """Creates an empty store, e.g. for the indexer."""
+    return _get_backend(backend)(dimension, path, **options)
+
+
+def load_vector_store(backend: str, dimension: int, path: Optional[str] = None, **options) -> VectorStore:
+    """Opens an existing store. Raises FileNotFoundError when a local index has not been built yet."""
+    store_class = _get_backend(backend)
+    if store_class is not PineconeVectorStore and not os.path.exists(path):
+        raise FileNotFoundError(f"Vector index file {path} not found. Please run the indexing process first.")
+    return store_class.load(dimension, path, **options)
@@ -0,0 +1,201 @@
+import bisect
+import fcntl
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import timedelta
+from typing import Dict, Optional, Sequence
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .base.metrics import DEFAULT_BUCKETS
+from .models import PerformanceMetric, PerformanceRollup, SystemPrompt
+
+
+# PerformanceMetric rows written per query by QuantumAssistantConversation.save_metrics
+ROLLED_UP_METRICS = ("iterations", "out_of_context", "input_tokens", "output_tokens", "total_seconds")
+TOTAL_FIELDS = ("queries", "iterations", "out_of_context", "input_tokens", "output_tokens", "latency_sum")
+HOURLY_SUMMARIES = 24
+# PostgreSQL advisory lock key held by a rollup run
+ROLLUP_LOCK_ID = 0x726F6C6C7570  # "rollup"
+
+
+def empty_totals() -> Dict:
+    totals = dict.fromkeys(TOTAL_FIELDS, 0)
+    totals["latency_buckets"] = [0] * (len(DEFAULT_BUCKETS) + 1)
+    return totals
+
+
+def add_metric(totals: Dict, metric_name: str, value: float):
+    if metric_name == "iterations":
+        # One iterations row per query
+        totals["queries"] += 1
+        totals["iterations"] += value
+    elif metric_name == "total_seconds":
+        totals["latency_sum"] += value
+        totals["latency_buckets"][bisect.bisect_left(DEFAULT_BUCKETS, value)] += 1
+    else:
+        totals[metric_name] += value
+
+
+def merge_totals(into: Dict, totals: Dict):
+    for field in TOTAL_FIELDS:
+        into[field] += totals[field]
+    buckets = into["latency_buckets"] or [0] * len(totals["latency_buckets"])
+    into["latency_buckets"] = [a + b for a, b in zip(buckets, totals["latency_buckets"])]
+
+
+def bucket_percentile(bucket_counts: Sequence[int], q: float, buckets: Sequence[float] = DEFAULT_BUCKETS) -> Optional[float]:
+    """
+    Estimates the `q` quantile from histogram bucket counts, interpolating
+    linearly within the bucket. Values in the +Inf bucket are reported as the
+    largest finite bound.
+    """
+    total = sum(bucket_counts)
+    if not total:
+        return None
+
+    rank, running, lower = q * total, 0, 0.0
+    for bound, count in zip(buckets, bucket_counts):
+        if count and running + count >= rank:
+            return lower + (bound - lower) * (rank - running) / count
+        running += count
+        lower = bound
+    return lower
+
+
+def summarize(totals: Dict) -> Dict:
+    queries = totals["queries"]
+    latencies = sum(totals["latency_buckets"])
+    return {
+        "queries": queries,
+        "latency_p50": bucket_percentile(totals["latency_buckets"], 0.5),
+        "latency_p95": bucket_percentile(totals["latency_buckets"], 0.95),
+        "latency_p99": bucket_percentile(totals["latency_buckets"], 0.99),
+        "latency_mean": totals["latency_sum"] / latencies if latencies else None,
+        "mean_iterations": totals["iterations"] / queries if queries else None,
+        "out_of_context_rate": totals["out_of_context"] / queries if queries else None,
+        "input_tokens": totals["input_tokens"],
+        "output_tokens": totals["output_tokens"],
+    }
+
+
+def _rollup_totals(rollup: PerformanceRollup) -> Dict:
+    totals = {field: getattr(rollup, field) for field in TOTAL_FIELDS}
+    totals["latency_buckets"] = rollup.latency_buckets or [0] * (len(DEFAULT_BUCKETS) + 1)
+    return totals
+
+
+def _update_prompt(system_prompt: SystemPrompt, totals: Dict):
+    """Adds `totals` to the running totals in performance_metrics and refreshes its summaries."""
+    metrics = system_prompt.performance_metrics or {}
+    running = metrics.get("totals") or empty_totals()
+    merge_totals(running, totals)
+
+    hourly = system_prompt.performance_rollups.order_by("-hour")[:HOURLY_SUMMARIES]
+    system_prompt.performance_metrics = {
+        **metrics,
+        "updated_at": timezone.now().isoformat(),
+        "totals": running,
+        "summary": summarize(running),
+        "hourly": [
+            {"hour": rollup.hour.isoformat(), **summarize(_rollup_totals(rollup))}
+            for rollup in reversed(hourly)
+        ],
+    }
+    system_prompt.save(update_fields=["performance_metrics"])
+
+
+@contextmanager
+def rollup_lock():
+    """
+    Yields whether this process holds the rollup lock, without waiting for
+    it: a session advisory lock on PostgreSQL, a lock on a file next to the
+    database elsewhere (SQLite in development).
+    """
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_try_advisory_lock(%s)", [ROLLUP_LOCK_ID])
+            acquired = cursor.fetchone()[0]
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT pg_advisory_unlock(%s)", [ROLLUP_LOCK_ID])
+        return
+
+    with open(f"{settings.DATABASES['default']['NAME']}.rollup.lock", "w") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def rollup_metrics(batch_size: int = 10000, settle_seconds: int = 60) -> Optional[int]:
+    """
+    Adds the PerformanceMetric rows written since the last run to the hourly
+    PerformanceRollup rows and to SystemPrompt.performance_metrics, and
+    returns the number of rows rolled up, or None when another run holds
+    the rollup lock (two runs would count the same rows twice).
+    """
+    with rollup_lock() as acquired:
+        if not acquired:
+            return None
+        return _rollup_metrics(batch_size, settle_seconds)
+
+
+def _rollup_metrics(batch_size: int, settle_seconds: int) -> int:
+    """
+    Rows are taken in id order after the highest `last_metric_id` of the
+    rollups, and only once older than `settle_seconds`, so rows of
+    transactions still in flight are not skipped.
+    """
+    watermark = PerformanceRollup.objects.aggregate(last=Max("last_metric_id"))["last"] or 0
+    cutoff = timezone.now() - timedelta(seconds=settle_seconds)
+    processed = 0
+
+    while True:
+        rows = list(
+            PerformanceMetric.objects.filter(
+                id__gt=watermark, timestamp__lt=cutoff, metric_name__in=ROLLED_UP_METRICS
+            )
+            .order_by("id")
+            .values_list("id", "metric_name", "metric_value", "timestamp", "conversation__system_prompt_id")[
+                :batch_size
+            ]
+        )
+        if not rows:
+            return processed
+
+        hours = defaultdict(empty_totals)
+        for _, metric_name, value, timestamp, system_prompt_id in rows:
+            hour = timestamp.replace(minute=0, second=0, microsecond=0)
+            add_metric(hours[(system_prompt_id, hour)], metric_name, value)
+        watermark = rows[-1][0]
+
+        prompts = defaultdict(empty_totals)
+        with transaction.atomic():
+            for (system_prompt_id, hour), totals in hours.items():
+                rollup, _ = PerformanceRollup.objects.select_for_update().get_or_create(
+                    system_prompt_id=system_prompt_id, hour=hour
+                )
+                rollup_totals = _rollup_totals(rollup)
+                merge_totals(rollup_totals, totals)
+                for field, value in rollup_totals.items():
+                    setattr(rollup, field, value)
+                rollup.last_metric_id = watermark
+                rollup.save()
+                merge_totals(prompts[system_prompt_id], totals)
+
+            for system_prompt in SystemPrompt.objects.select_for_update().filter(id__in=prompts):
+                _update_prompt(system_prompt, prompts[system_prompt.id])
+
+        processed += len(rows)
@@ -4,6 +4,10 @@ from django.db.models import Q
 from .models import Conversation, Message
 
 
+# Messages shown in a conversation: the questions asked and their final answers
+VISIBLE_MESSAGES = Q(is_original_user_query=True) | Q(is_answer=True) | Q(is_out_of_context_message=True)
+
+
 class MessageSerializer(serializers.ModelSerializer):
     class Meta:
         model = Message
@@ -42,9 +46,10 @@ class ConversationSerializer(serializers.ModelSerializer):
     def get_messages(self, instance):
         # Check if this is a detail view
         if self.context.get("view").action == "retrieve":
-            messages = instance.messages.filter(
-                Q(is_original_user_query=True) | Q(is_answer=True) | Q(is_out_of_context_message=True)
-            )
+            # Prefetched by ConversationViewSet, queried here for other callers
+            messages = getattr(instance, "visible_messages", None)
+            if messages is None:
+                messages = instance.messages.filter(VISIBLE_MESSAGES).order_by("timestamp", "id")
             serializer = MessageSerializer(messages, many=True)
             return serializer.data
         return None
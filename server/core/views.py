@@ -1,13 +1,17 @@
+from django.db.models import Prefetch
 from rest_framework import viewsets, permissions, serializers
+from rest_framework.decorators import action
 
-from core.models import Conversation, SystemPrompt
-from core.serializer import ConversationSerializer
+from core.models import Conversation, Message, SystemPrompt
+from core.pagination import ConversationCursorPagination, MessageCursorPagination
+from core.serializer import VISIBLE_MESSAGES, ConversationSerializer, MessageSerializer
 
 
 class ConversationViewSet(viewsets.ModelViewSet):
     queryset = Conversation.objects.all()
     serializer_class = ConversationSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = ConversationCursorPagination
 
     def perform_create(self, serializer):
         assistant_type = serializer.validated_data.pop("assistant_type", None)
@@ -26,7 +30,27 @@ class ConversationViewSet(viewsets.ModelViewSet):
             )
 
     def get_queryset(self):
-        return Conversation.objects.filter(user=self.request.user)
+        queryset = Conversation.objects.filter(user=self.request.user).select_related("system_prompt")
+        if self.action == "retrieve":
+            # The shown messages in one query, in the order ConversationSerializer returns them
+            queryset = queryset.prefetch_related(
+                Prefetch(
+                    "messages",
+                    queryset=Message.objects.filter(VISIBLE_MESSAGES).order_by("timestamp", "id"),
+                    to_attr="visible_messages",
+                )
+            )
+        return queryset
+
+    @action(detail=True, methods=["get"])
+    def messages(self, request, pk=None):
+        """The shown messages of a conversation, a page at a time, for histories too long to retrieve at once."""
+        conversation = self.get_object()
+        paginator = MessageCursorPagination()
+        page = paginator.paginate_queryset(
+            conversation.messages.filter(VISIBLE_MESSAGES), request, view=self
+        )
+        return paginator.get_paginated_response(MessageSerializer(page, many=True).data)
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
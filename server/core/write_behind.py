@@ -0,0 +1,37 @@
+from typing import Dict, List, Type
+
+from django.db import models, transaction
+
+
+class WriteBehindBuffer:
+    """
+    Collects new model instances and inserts them at `flush`, with one
+    `bulk_create` per model in a short transaction.
+
+    Models are inserted in the order they were first added, so instances
+    may refer to instances of a model added before them (e.g. an AIResponse
+    to a Message of the same flush): bulk_create sets their primary keys on
+    databases that return them (PostgreSQL, SQLite 3.35+).
+    """
+
+    def __init__(self):
+        self._pending: Dict[Type[models.Model], List[models.Model]] = {}
+
+    def add(self, instance: models.Model) -> models.Model:
+        self._pending.setdefault(type(instance), []).append(instance)
+        return instance
+
+    def flush(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        with transaction.atomic():
+            for model, instances in pending.items():
+                model.objects.bulk_create(instances)
+
+    def discard(self):
+        """Drops the instances not flushed yet, e.g. those of a failed request."""
+        self._pending = {}
+
+    def __len__(self) -> int:
+        return sum(len(instances) for instances in self._pending.values())
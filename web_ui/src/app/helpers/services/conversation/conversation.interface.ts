@@ -7,6 +7,12 @@ export interface ConversationBrief {
     updated_at: string
 }
 
+export interface CursorPage<T> {
+    next: string | null
+    previous: string | null
+    results: T[]
+}
+
 export interface CreateConversationResponse {
     id: number
     title: string
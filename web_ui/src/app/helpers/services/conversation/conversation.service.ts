@@ -1,7 +1,7 @@
 import { HttpClient } from '@angular/common/http';
 import { Injectable } from '@angular/core';
 import { assistantQueryUrl, conversationsUrl } from '../../urls';
-import { ConversationBrief, ConversationI, CreateConversationResponse, MessageI } from './conversation.interface';
+import { ConversationBrief, ConversationI, CreateConversationResponse, CursorPage, MessageI } from './conversation.interface';
 import { AssistantType } from './conversation.enums';
 
 @Injectable({
@@ -13,14 +13,19 @@ export class ConversationService {
     private http: HttpClient
   ) { }
 
-  getConversations() {
-    return this.http.get<ConversationBrief>(conversationsUrl);
+  // Pass the `next` / `previous` url of a page to get the following one
+  getConversations(pageUrl?: string) {
+    return this.http.get<CursorPage<ConversationBrief>>(pageUrl || conversationsUrl);
   }
 
   getConversation(id: string) {
     return this.http.get<ConversationI>(conversationsUrl + id + '/');
   }
 
+  getMessages(id: string, pageUrl?: string) {
+    return this.http.get<CursorPage<MessageI>>(pageUrl || conversationsUrl + id + '/messages/');
+  }
+
   startConversations(title: string, assistantType: AssistantType) {
     return this.http.post<CreateConversationResponse>(conversationsUrl, { title, assistant_type: assistantType });
   }
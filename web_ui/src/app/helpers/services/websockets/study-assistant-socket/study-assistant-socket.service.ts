@@ -11,6 +11,8 @@ import { ConversationMessageI } from './study-assistant.interface';
 export class StudyAssistantSocketService {
   conversationMap = new Map<string, ConversationMessageI[]>();
   conversationSocketMap = new Map<string, WebSocketSubject<any>>();
+  // Answer being streamed per conversation, completed by 'assistant_message'
+  streamingMap = new Map<string, { iteration: number, message: ConversationMessageI }>();
 
   constructor() { }
 
@@ -63,17 +65,55 @@ export class StudyAssistantSocketService {
       return;
     }
 
+    const streaming = this.streamingMap.get(conversationId);
+    this.streamingMap.delete(conversationId);
+    if (streaming) {
+      // The parsed answer replaces the streamed text
+      streaming.message.message = message;
+      return;
+    }
+
     conversation.push({
       from: 'system',
       message
     })
   }
 
+  onAssistantDelta(conversationId: string, msg: any) {
+    const conversation = this.conversationMap.get(conversationId);
+
+    if(!conversation) {
+      console.error(`Message received for unknown conversation ${conversation}`, msg);
+      return;
+    }
+
+    let streaming = this.streamingMap.get(conversationId);
+    if (!streaming) {
+      streaming = { iteration: msg['iteration'], message: { from: 'system', message: '' } };
+      this.streamingMap.set(conversationId, streaming);
+      conversation.push(streaming.message);
+    } else if (streaming.iteration != msg['iteration']) {
+      // A follow-up iteration answers again from scratch
+      streaming.iteration = msg['iteration'];
+      streaming.message.message = '';
+    }
+
+    streaming.message.message += msg['text'];
+  }
+
   onMessage(conversationId: string, msg: any) {
     switch (msg['type']) {
       case 'assistant_message':
         this.onAssistantMessage(conversationId, msg);
         break;
+
+      case 'assistant_delta':
+        this.onAssistantDelta(conversationId, msg);
+        break;
+
+      case 'assistant_error':
+        console.error(`Query rejected`, msg['errors'])
+        break;
     
       default:
         console.error(`Unknown Message received`, msg)